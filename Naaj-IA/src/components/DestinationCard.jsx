@@ -2,6 +2,7 @@
 
 import React, { useState } from 'react';
 import '../styles/DestinationCard.css';
+import { pickImage } from '../services/images';
 
 const DestinationCard = ({ place, onClick }) => {
   const [imgError, setImgError] = useState(false);
@@ -31,7 +32,8 @@ const DestinationCard = ({ place, onClick }) => {
   if (imgError || !place.imagen || place.imagen === "NO_IMAGE") {
     displayImage = getFallbackImage(place.nombre);
   } else {
-    displayImage = place.imagen;
+    // La tarjeta mide 200x250 y la foto la cubre: basta una variante de ~340px de ancho (a 1x: la de 400)
+    displayImage = pickImage(place, 340, 1);
   }
 
   return (
@@ -42,7 +44,7 @@ const DestinationCard = ({ place, onClick }) => {
     >
       {/* Imagen invisible solo para detectar errores de carga */}
       <img 
-          src={place.imagen} 
+          src={displayImage} 
           alt="detector"
           style={{ display: 'none' }}
           onError={() => {
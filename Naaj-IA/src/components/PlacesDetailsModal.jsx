@@ -1,12 +1,13 @@
 import React from 'react';
 import '../styles/PlaceDetailsModal.css';
+import { pickImage } from '../services/images';
 
 const PlaceDetailsModal = ({ place, onClose, onAddReview, isBlurred }) => {
   if (!place) return null;
 
   // Fallback de imagen si viene vacía o NO_IMAGE
   const bgImage = (place.imagen && place.imagen !== "NO_IMAGE") 
-    ? place.imagen 
+    ? pickImage(place, 500, 2) // el encabezado mide hasta 500px de ancho
     : "https://images.unsplash.com/photo-1596130152098-93e71bf4b274?w=600&q=80";
 
   // Formatear estado de apertura
@@ -0,0 +1,14 @@
+// elige la variante de la foto (place.imagenes = { ancho: url }) según el tamaño en pantalla
+
+// Devuelve la URL más chica que cubre `cssWidth` px en esta pantalla; si no hay variantes, place.imagen.
+// `maxDpr` limita la densidad: en miniaturas una foto 2x/3x no se nota y cuesta 4-9 veces los bytes.
+// El backend precalienta los anchos de estas llamadas (PHOTO_VIEWS en app.py): si cambian, cámbialos allá también.
+export const pickImage = (place, cssWidth, maxDpr = 2) => {
+  const variants = place?.imagenes;
+  if (!variants || Object.keys(variants).length === 0) return place?.imagen;
+
+  const needed = cssWidth * Math.min(window.devicePixelRatio || 1, maxDpr);
+  const widths = Object.keys(variants).map(Number).sort((a, b) => a - b);
+  const best = widths.find((w) => w >= needed) ?? widths[widths.length - 1];
+  return variants[best];
+};
@@ -1,17 +1,27 @@
 import os
 import json
-import requests
-import urllib.parse
-from math import radians, sin, cos, sqrt, atan2
-from flask import Flask, request, jsonify, send_from_directory, Response, redirect
+import http_client
+from cache import FLIGHTS, TTLCache, PlaceDetailsCache, PhotoCache
+from budget import BudgetExceeded, QuotaBudget
+from breaker import CircuitOpen, breaker, breakers_stats
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response, redirect
 from flask_cors import CORS, cross_origin
 from dotenv import load_dotenv
-import google.generativeai as genai
 from langdetect import detect
 from datetime import datetime
 import pytz # 🆕 Librería para Zona Horaria
 import random
 import re
+import uuid
+import threading
+import time
+from itertools import chain
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from catalog import Catalog, fold_text, generate_maps_link, normalize_name
+from persistence import ReviewLog, WriteBehindSaver, file_lock
+from destinations import DestinationPools, DestinationsSnapshot
+from storage import LocalJsonStorage, content_version, storage_from_env
 
 # -----------------------------
 # 1. CONFIGURACIÓN
@@ -19,77 +29,321 @@ import re
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-# 🆕 Nuevas llaves para la base de datos JSONBin
-JSONBIN_API_KEY = os.getenv("JSONBIN_API_KEY")
-JSONBIN_BIN_ID = os.getenv("JSONBIN_BIN_ID")
-
-genai.configure(api_key=GEMINI_API_KEY)
+# URLs base de las APIs externas; se cambian para usar los servidores falsos (ver fakes.py)
+GOOGLE_PLACES_BASE_URL = os.getenv("GOOGLE_PLACES_BASE_URL", "https://maps.googleapis.com/maps/api/place").rstrip("/")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# Semilla fija para que las pruebas de carga con fixtures pidan siempre lo mismo (vacío = aleatorio)
+RNG = random.Random(os.getenv("NAAJ_RANDOM_SEED") or None)
+# Carpeta local para la bitácora de reseñas y los snapshots
+NAAJ_STATE_DIR = os.getenv("NAAJ_STATE_DIR", "naaj_state")
+SAVE_DEBOUNCE_SECONDS = float(os.getenv("SAVE_DEBOUNCE_SECONDS", "5"))
+REVIEW_LOG_COMPACT_EVERY = int(os.getenv("REVIEW_LOG_COMPACT_EVERY", "500"))
+# Caché de búsquedas de Google: segundos de vigencia, ventana extra sirviendo lo
+# viejo mientras se renueva, tamaño máximo y tamaño de la celda (grados, ~1 km)
+GOOGLE_CACHE_TTL = float(os.getenv("GOOGLE_CACHE_TTL", "900"))
+GOOGLE_CACHE_STALE_TTL = float(os.getenv("GOOGLE_CACHE_STALE_TTL", "3600"))
+GOOGLE_CACHE_SIZE = int(os.getenv("GOOGLE_CACHE_SIZE", "512"))
+GOOGLE_CACHE_CELL_DEG = float(os.getenv("GOOGLE_CACHE_CELL_DEG", "0.01"))
+# Vigencia (segundos) de los detalles de Google guardados en disco
+PLACE_DETAILS_STATIC_TTL = float(os.getenv("PLACE_DETAILS_STATIC_TTL", str(7 * 24 * 3600)))
+PLACE_DETAILS_HOURS_TTL = float(os.getenv("PLACE_DETAILS_HOURS_TTL", "600"))
+# Vigencia del place_id resuelto por nombre (Google recomienda refrescarlos cada pocos meses)
+PLACE_ID_MEMO_TTL = float(os.getenv("PLACE_ID_MEMO_TTL", str(30 * 24 * 3600)))
+# Topes de gasto en Google (USD, 0 = sin tope); al llegar se responde con caché o datos locales
+GOOGLE_DAILY_BUDGET_USD = float(os.getenv("GOOGLE_DAILY_BUDGET_USD", "10"))
+GOOGLE_MONTHLY_BUDGET_USD = float(os.getenv("GOOGLE_MONTHLY_BUDGET_USD", "200"))
+# Circuit breakers: segundos a partir de los cuales una llamada cuenta como lenta y
+# cuánto tiempo se deja de llamar a un servicio que está fallando
+GOOGLE_SLOW_CALL_SECONDS = float(os.getenv("GOOGLE_SLOW_CALL_SECONDS", "4"))
+GEMINI_SLOW_CALL_SECONDS = float(os.getenv("GEMINI_SLOW_CALL_SECONDS", "20"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+# Fotos de Google en disco: tope de tamaño y cuánto tiempo las guarda el navegador o la CDN
+PHOTO_CACHE_MAX_MB = float(os.getenv("PHOTO_CACHE_MAX_MB", "500"))
+PHOTO_MAX_AGE = float(os.getenv("PHOTO_MAX_AGE", str(30 * 24 * 3600)))
+PHOTO_CHUNK_BYTES = 64 * 1024
+# Anchos (px) en que se piden y guardan las fotos; ?w= se ajusta al siguiente hacia arriba
+PHOTO_WIDTHS = tuple(sorted(int(w) for w in os.getenv("PHOTO_WIDTHS", "200,400,800,1200").split(",")))
+PHOTO_DEFAULT_WIDTH = int(os.getenv("PHOTO_DEFAULT_WIDTH", "400"))
+PHOTO_FALLBACK = "https://images.unsplash.com/photo-1596130152098-93e71bf4b274?w=500&q=80"
+# Tamaño en pantalla de cada vista del frontend: (ancho CSS, densidad máxima). Es copia de
+# las llamadas a pickImage (Naaj-IA/src/services/images.js): si cambian allá, cámbialas aquí
+PHOTO_VIEWS = {"card": (340, 1), "modal": (500, 2)}
+# Precalentado de fotos: descargas simultáneas (0 = apagado), lugares por corrida,
+# anchos (por omisión, los que piden las vistas; ver photo_warm_widths) y fracción máxima del presupuesto diario
+PHOTO_WARM_CONCURRENCY = int(os.getenv("PHOTO_WARM_CONCURRENCY", "4"))
+PHOTO_WARM_MAX_PLACES = int(os.getenv("PHOTO_WARM_MAX_PLACES", "60"))
+PHOTO_WARM_BUDGET_SHARE = float(os.getenv("PHOTO_WARM_BUDGET_SHARE", "0.25"))
+# /destinations: categorías de los pools de Google y cada cuánto se renuevan (segundos)
+DESTINATION_CATEGORIES = ["cafeterias bonitas", "tacos populares", "parques tranquilos", "museos", "cenas romanticas", "comida regional"]
+DESTINATIONS_REFRESH_SECONDS = float(os.getenv("DESTINATIONS_REFRESH_SECONDS", str(6 * 3600)))
+# Reseñas por página en /place_details y /places/<id>/reviews
+REVIEWS_PAGE_SIZE = 10
+REVIEWS_MAX_PAGE_SIZE = 50
+# Tamaño por defecto y máximo de /rankings
+RANKINGS_SIZE = 10
+RANKINGS_MAX_SIZE = 50
+# Tiempo máximo para descargar la nube en segundo plano
+DATASET_REFRESH_TIMEOUT = float(os.getenv("DATASET_REFRESH_TIMEOUT", os.getenv("CLOUD_REFRESH_TIMEOUT", "10")))
+# Cada cuánto se revisa si el documento base cambió (0 = nunca)
+DATASET_REFRESH_SECONDS = float(os.getenv("DATASET_REFRESH_SECONDS", "60"))
+
+# Si Gemini falla o tarda de más, se responde solo con los datos encontrados
+GEMINI_BREAKER = breaker("gemini", slow_call_seconds=GEMINI_SLOW_CALL_SECONDS, open_seconds=BREAKER_OPEN_SECONDS)
 
 app = Flask(__name__)
 CORS(app)
 
 # -----------------------------
-# 🆕 GESTIÓN DE DATOS EN LA NUBE (JSONBIN)
+# 🆕 GESTIÓN DE DATOS (JSONBIN / SQLITE / LOCAL)
 # -----------------------------
-def load_data():
-    """Carga los datos desde JSONBin. Si falla, usa el archivo local."""
-    print("☁️ Cargando datos desde la nube...")
-    
-    if not JSONBIN_API_KEY or not JSONBIN_BIN_ID:
-        print("⚠️ Faltan credenciales de JSONBin. Usando modo local.")
-        return load_local_data()
+# El almacenamiento se elige con NAAJ_STORAGE (ver storage.py)
+STORAGE = storage_from_env(NAAJ_STATE_DIR)
 
-    url = f"https://api.jsonbin.io/v3/b/{JSONBIN_BIN_ID}"
-    headers = {"X-Master-Key": JSONBIN_API_KEY}
-    
-    try:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            # JSONBin devuelve los datos dentro de la llave "record"
-            data = response.json().get("record", {})
-            print("✅ Datos cargados exitosamente desde JSONBin.")
-            return data
-        else:
-            print(f"⚠️ Error cargando nube ({response.status_code}). Usando local.")
-            return load_local_data()
-    except Exception as e:
-        print(f"❌ Error conexión nube: {e}")
-        return load_local_data()
+def load_data():
+    """Datos para arrancar sin esperar a la red: (documento, origen).
+
+    Si el almacenamiento es remoto (JSONBin) se arranca con el archivo local y
+    la nube se descarga en segundo plano (ver refresh_dataset).
+    """
+    if STORAGE.remote:
+        return load_local_data(), "local"
+    data = STORAGE.load()
+    if data is None:
+        return load_local_data(), "local"
+    return data, STORAGE.name
 
 def load_local_data():
     """Carga datos del archivo local como respaldo."""
-    try:
-        with open("campeche.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
+    data = LocalJsonStorage("campeche.json").load()
+    if data is None:
         print("⚠️ ALERTA: campeche.json no encontrado. Iniciando vacío.")
         return {"municipios_data": {}, "restaurantes_famosos": [], "lugares_comunidad": []}
+    return data
 
 def save_data_cloud(data):
-    """Guarda los cambios en JSONBin para persistencia real."""
-    if not JSONBIN_API_KEY or not JSONBIN_BIN_ID:
-        print("⚠️ No se puede guardar en la nube: Faltan credenciales.")
-        return
-
-    print("☁️ Guardando cambios en la nube...")
-    url = f"https://api.jsonbin.io/v3/b/{JSONBIN_BIN_ID}"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Master-Key": JSONBIN_API_KEY
-    }
-    
-    try:
-        # PUT actualiza el contenido del Bin existente
-        response = requests.put(url, json=data, headers=headers)
-        if response.status_code == 200:
-            print("✅ Base de datos actualizada en JSONBin.")
+    """Guarda los cambios en el almacenamiento configurado. Devuelve True si se guardó."""
+    return STORAGE.save(data)
+
+def snapshot_data():
+    """Serializa el documento completo de forma consistente: (json, seq de la bitácora)."""
+    with DATA_LOCK:
+        return json.dumps(CATALOG.to_document(), ensure_ascii=False), REVIEW_LOG.seq
+
+def storage_base():
+    """Nombre con el que queda marcado en el snapshot un documento traído del almacenamiento."""
+    return "cloud" if STORAGE.remote else STORAGE.name
+
+def base_is_authoritative():
+    """False mientras se trabaja sobre el respaldo local esperando a la nube."""
+    return REVIEW_LOG.base != "local" or not STORAGE.remote
+
+def upload_entries():
+    """Guarda solo las reseñas que le faltan al almacenamiento (SQLite: una fila por reseña).
+
+    Devuelve None si la bitácora ya no las tiene todas (se compactaron): toca subir el documento.
+    Se sube con el candado de refresco tomado: un refresco que vio la versión nueva antes de
+    marcarla como propia espera y, al entrar, la encuentra marcada (no descarga lo que se subió).
+    """
+    with REVIEW_LOG.upload_lock() as acquired, REVIEW_LOG.refresh_lock() as refresh_free:
+        if not (acquired and refresh_free): return False
+        uploaded = REVIEW_LOG.uploaded_seq
+        entries = REVIEW_LOG.entries_after(uploaded)
+        if not entries: return True if REVIEW_LOG.seq <= uploaded else None
+        if entries[0]["seq"] != uploaded + 1: return None
+        if not STORAGE.append_entries(entries): return False
+        REVIEW_LOG.mark_uploaded(entries[-1]["seq"])
+        # La versión nueva es la propia: el refresco no la vuelve a descargar
+        REVIEW_LOG.mark_base_version(STORAGE.version())
+    return True
+
+def persist_data():
+    """Compacta la bitácora si ya creció y sube el documento si la nube va atrasada."""
+    sync_state()
+    # Sobre el respaldo local no se compacta ni se sube: se pisarían datos de la nube
+    if not base_is_authoritative(): return True
+    needs_upload = cloud_enabled and REVIEW_LOG.seq > REVIEW_LOG.uploaded_seq
+    if needs_upload and hasattr(STORAGE, "append_entries"):
+        # Va antes de compactar: la compactación recorta de la bitácora las reseñas que se suben aquí
+        uploaded = upload_entries()
+        if uploaded is False: return False
+        if uploaded: needs_upload = False
+    if not needs_upload and not REVIEW_LOG.needs_compaction():
+        return True
+
+    data_json, seq = snapshot_data()
+    if REVIEW_LOG.needs_compaction():
+        REVIEW_LOG.compact(data_json, seq)
+    if needs_upload:
+        # Con varios workers, solo uno sube; los demás reintentan después
+        with REVIEW_LOG.upload_lock() as acquired, REVIEW_LOG.refresh_lock() as refresh_free:
+            if not (acquired and refresh_free): return False
+            if seq <= REVIEW_LOG.uploaded_seq: return True
+            if not save_data_cloud(data_json): return False
+            REVIEW_LOG.mark_uploaded(seq)
+            # La versión nueva es la propia: el refresco no la vuelve a descargar
+            REVIEW_LOG.mark_base_version(STORAGE.version())
+    return True
+
+def apply_review(entry, catalog=None):
+    """Aplica una reseña (del endpoint o de la bitácora) al documento en memoria."""
+    with DATA_LOCK:
+        catalog = catalog or CATALOG
+        place = catalog.find(entry["place_name"])
+
+        if not place:
+            print(f"🆕 Nuevo lugar: {entry['place_name']}")
+            # Se agrega a 'lugares_comunidad' y queda indexado en el catálogo
+            place = catalog.add_community_place(dict(entry["new_place"], reviews=[]))
+
+        # O(1) el promedio (agregados del lugar) y O(log n) los rankings; las repetidas se ignoran
+        catalog.add_review(place, entry["review"])
+        DESTINATIONS_DIRTY.set()
+        return place.data["rating"]
+
+def apply_entry(entry, catalog=None):
+    """Aplica una entrada de la bitácora según su tipo."""
+    if entry.get("op") == "review": apply_review(entry, catalog)
+
+def carried_entries(catalog):
+    """Reseñas propias (con id) del catálogo actual, como entradas para reaplicar sobre otro documento."""
+    for place in catalog.by_id.values():
+        reviews = [r for r in place.reviews if r.get("id")]
+        if not reviews: continue
+        new_place = dict(place.data)
+        # Se reaplican en el orden en que llegaron (de la más antigua a la más nueva)
+        for review in reviews:
+            yield {"op": "review", "place_name": place.nombre, "new_place": new_place, "review": review}
+
+def install_dataset(catalog, log_tail):
+    """Reaplica la bitácora sobre un catálogo nuevo y lo publica cambiando una sola referencia.
+
+    Las peticiones en curso conservan el catálogo que tomaron al empezar.
+    """
+    global CATALOG, DATASET_LOADED_AT
+    with DATA_LOCK:
+        applied = 0
+        for entry in log_tail:
+            apply_entry(entry, catalog)
+            applied += 1
+        CATALOG = catalog
+        DATASET_LOADED_AT = datetime.now().isoformat(timespec="seconds")
+        if applied:
+            print(f"📝 Reaplicadas {applied} reseñas de la bitácora local.")
+    PHOTO_WARM_REQUEST.set()  # catálogo nuevo: precalentar sus fotos (ver photo_warm_loop)
+    DESTINATIONS_DIRTY.set()
+
+def reload_state():
+    """Reconstruye el documento y el catálogo desde el último snapshot + la bitácora."""
+    with DATA_LOCK:
+        data, log_tail = REVIEW_LOG.load(load_data)
+        # Catálogo indexado: se construye una sola vez y se actualiza con cada alta
+        install_dataset(Catalog(data), log_tail)
+
+def sync_state():
+    """Pone al día este proceso con lo que otros workers escribieron en la bitácora."""
+    if not REVIEW_LOG.changed(): return
+    with DATA_LOCK:
+        if not REVIEW_LOG.sync(apply_entry):
+            reload_state()
+
+def refresh_dataset():
+    """Revisa la versión del documento base y, solo si cambió, lo descarga y cambia el catálogo.
+
+    Devuelve True cuando este proceso quedó al día (False = reintentar pronto).
+    """
+    sync_state()
+    version = STORAGE.version()
+    if version and version == REVIEW_LOG.base_version and base_is_authoritative():
+        return True
+
+    with REVIEW_LOG.refresh_lock() as acquired:
+        if not acquired: return False  # otro proceso está refrescando
+        sync_state()  # quien tenía el candado pudo haberlo traído ya
+        if version and version == REVIEW_LOG.base_version and base_is_authoritative():
+            return True
+        data = STORAGE.load(timeout=(5, DATASET_REFRESH_TIMEOUT)) if STORAGE.remote else STORAGE.load()
+        if data is None: return False
+        version = version or content_version(data)
+        if version == REVIEW_LOG.base_version and base_is_authoritative():
+            return True
+
+        # El catálogo nuevo (con todos sus índices) se arma fuera del candado
+        catalog = Catalog(data)
+        with DATA_LOCK:
+            sync_state()
+            if REVIEW_LOG.base == "local" and STORAGE.remote:
+                # Arranque con el respaldo local: todavía no se ha compactado nada
+                log_tail = REVIEW_LOG.entries_after(0)
+            elif STORAGE.enabled:
+                if REVIEW_LOG.uploaded_seq < REVIEW_LOG.snapshot_seq:
+                    # El almacenamiento no tiene todo lo que guarda el snapshot: primero se sube
+                    SAVER.mark_dirty()
+                    return False
+                # Se reaplica lo que el almacenamiento aún no tiene (las reseñas repetidas se ignoran)
+                log_tail = REVIEW_LOG.entries_after(REVIEW_LOG.snapshot_seq)
+            else:
+                # campeche.json es de solo lectura: las reseñas propias pasan al documento nuevo
+                log_tail = list(carried_entries(CATALOG))
+            install_dataset(catalog, log_tail)
+            REVIEW_LOG.base = storage_base()
+            REVIEW_LOG.compact(*snapshot_data(), force=True)
+            REVIEW_LOG.mark_base_version(version)
+            REVIEW_LOG.publish()
+        print(f"🔄 Documento base actualizado ({version}).")
+    SAVER.mark_dirty()
+    return True
+
+def dataset_refresh_loop():
+    """Hilo de fondo: primera descarga al arrancar y luego revisión periódica de la versión."""
+    delay = 5
+    while True:
+        DATASET_REFRESH["checked_at"] = datetime.now().isoformat(timespec="seconds")
+        try:
+            done = refresh_dataset()
+        except Exception as e:
+            print(f"❌ Error refrescando el documento base: {e}")
+            done = False
+        if done:
+            DATASET_REFRESH["status"] = "ok"
+            if DATASET_REFRESH_SECONDS <= 0: return  # solo la descarga inicial
+            delay = 5
+            time.sleep(DATASET_REFRESH_SECONDS)
         else:
-            print(f"⚠️ Error al guardar en JSONBin: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Error guardando en nube: {e}")
+            DATASET_REFRESH["status"] = "retrying"
+            time.sleep(delay)
+            delay = min(delay * 2, max(DATASET_REFRESH_SECONDS, 300))
 
 # Carga Inicial (Variable Global en Memoria)
-CAMPECHE_DATA = load_data()
+# Arranque instantáneo: último snapshot local (o el respaldo local) + la cola de la
+# bitácora. El documento base se revisa después, en segundo plano. Con varios
+# workers, el primero en arrancar deja un snapshot y los demás lo reusan.
+DATA_LOCK = threading.RLock()
+PHOTO_WARM_REQUEST = threading.Event()
+DESTINATIONS_DIRTY = threading.Event()  # el catálogo o algún rating cambió: rearmar /destinations
+REVIEW_LOG = ReviewLog(NAAJ_STATE_DIR, compact_every=REVIEW_LOG_COMPACT_EVERY)
+with REVIEW_LOG.boot_lock():
+    reload_state()
+    if not REVIEW_LOG.has_snapshot() and base_is_authoritative():
+        REVIEW_LOG.compact(*snapshot_data())
+        REVIEW_LOG.mark_base_version(STORAGE.version())
+
+# Guardado diferido: compactación local y subida a la nube en lote
+cloud_enabled = STORAGE.enabled
+SAVER = WriteBehindSaver(persist_data, debounce=SAVE_DEBOUNCE_SECONDS)
+
+# Recarga en caliente: un hilo por proceso (ver start_background_threads); solo uno
+# descarga a la vez y los demás se enteran por el archivo de generación (ver sync_state)
+DATASET_REFRESH = {"status": "pending", "checked_at": None}
+
+def prewarm_connections():
+    """Abre las conexiones con Google y JSONBin antes de la primera petición."""
+    urls = []
+    if GOOGLE_API_KEY: urls.append(GOOGLE_PLACES_BASE_URL + "/")
+    if GEMINI_API_KEY: urls.append(GEMINI_BASE_URL + "/")
+    if STORAGE.remote: urls.append(STORAGE.base_url + "/")
+    if urls: http_client.prewarm(urls)
 
 # -----------------------------
 # 2. UTILIDADES
@@ -102,121 +356,495 @@ def get_mexico_time():
     except Exception:
         return datetime.now() # Fallback si pytz falla
 
-def haversine(lat1, lon1, lat2, lon2):
-    if lat1 is None or lon1 is None or lat2 is None or lon2 is None: return 9999.0
-    R = 6371.0
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    return R * c
-
 def extract_keywords(text):
     STOP_WORDS = {"el", "la", "los", "las", "un", "una", "de", "del", "en", "a", "al", "y", "o", "pero", "si", "no", "es", "son", "estoy", "quiero", "quisiera", "recomiendame", "dime", "donde", "hay", "cerca", "lugares", "para", "ir", "hola", "naaj", "gracias", "por", "favor", "que", "tal", "esta", "tan", "busco", "necesito", "tienes", "informacion", "sobre", "cual", "cuales"}
     clean_phrase = re.sub(r'[^\w\s]', '', text.lower())
     return [w for w in clean_phrase.split() if w not in STOP_WORDS and len(w) > 2]
 
-def generate_maps_link(lat, lng, name, address):
-    if lat and lng: return f"https://www.google.com/maps/search/?api=1&query={lat},{lng}"
-    query = urllib.parse.quote(f"{name} {address}")
-    return f"https://www.google.com/maps/search/?api=1&query={query}"
-
 # -----------------------------
 # 3. FUNCIONES DE GOOGLE
 # -----------------------------
-def search_google_places(query, lat=None, lng=None, type_search="general"):
-    if not GOOGLE_API_KEY: return []
-    base_url = "https://maps.googleapis.com/maps/api/place"
+# Toda llamada de pago a Google pasa por el presupuesto (ver budget.py)
+BUDGET = QuotaBudget(os.getenv("BUDGET_DB_PATH", os.path.join(NAAJ_STATE_DIR, "budget.db")),
+                     daily_limit=GOOGLE_DAILY_BUDGET_USD, monthly_limit=GOOGLE_MONTHLY_BUDGET_USD)
+# Con Google caído o lento se deja de llamar un rato y se responde con caché o datos locales.
+# Quedarse sin presupuesto no dice nada de la salud de Google: no cuenta como falla.
+GOOGLE_BREAKER = breaker("google", slow_call_seconds=GOOGLE_SLOW_CALL_SECONDS, open_seconds=BREAKER_OPEN_SECONDS,
+                         ignore=(BudgetExceeded,))
+GOOGLE_SEARCH_CACHE = TTLCache(maxsize=GOOGLE_CACHE_SIZE, ttl=GOOGLE_CACHE_TTL, stale_ttl=GOOGLE_CACHE_STALE_TTL)
+# Detalles por place_id en disco: horario con vigencia corta, lo demás larga
+PLACE_DETAILS_CACHE = PlaceDetailsCache(
+    os.getenv("PLACE_DETAILS_CACHE_PATH", os.path.join(NAAJ_STATE_DIR, "place_details.db")),
+    {"static": PLACE_DETAILS_STATIC_TTL, "hours": PLACE_DETAILS_HOURS_TTL})
+
+PHOTO_CACHE = PhotoCache(os.getenv("PHOTO_CACHE_DIR", os.path.join(NAAJ_STATE_DIR, "photos")),
+                         max_bytes=int(PHOTO_CACHE_MAX_MB * 1024 * 1024))
+
+def geocell(lat, lng):
+    """Redondea la posición a una celda, así los usuarios cercanos comparten resultados."""
+    if not (lat and lng): return None
+    return (round(float(lat) / GOOGLE_CACHE_CELL_DEG) * GOOGLE_CACHE_CELL_DEG,
+            round(float(lng) / GOOGLE_CACHE_CELL_DEG) * GOOGLE_CACHE_CELL_DEG)
+
+def google_call(endpoint, fn):
+    """Llamada de pago a Google: primero el breaker (abierto = ni se cobra) y luego el presupuesto."""
+    def run():
+        BUDGET.spend(endpoint)
+        return fn()
+    return GOOGLE_BREAKER.call(run)
+
+# Status de Google que sí hablan de su salud; NOT_FOUND, INVALID_REQUEST, REQUEST_DENIED...
+# son errores de la petición (id viejo, llave mal puesta) y no deben abrir el circuito
+GOOGLE_TRANSIENT_STATUS = ("UNKNOWN_ERROR", "OVER_QUERY_LIMIT")
+
+def google_get_json(endpoint, url):
+    """GET a una API JSON de Google; solo 5xx, errores de red y status transitorios cuentan como falla del breaker."""
+    def fetch():
+        resp = http_client.get(url)
+        if resp.status_code >= 500:
+            raise RuntimeError(f"Google Places respondió {resp.status_code}")
+        data = resp.json()
+        if data.get("status") in GOOGLE_TRANSIENT_STATUS:
+            raise RuntimeError(f"Google Places respondió {data['status']}")
+        return data
+    data = google_call(endpoint, fetch)
+    # Google contestó bien: el error es de la petición y se lanza fuera del breaker
+    if data.get("status", "OK") not in ("OK", "ZERO_RESULTS"):
+        raise RuntimeError(f"Google Places respondió {data.get('status')}")
+    return data
+
+def log_google_error(label, e):
+    # Con el circuito abierto cada petición fallaría igual: no se llena el log
+    if not isinstance(e, CircuitOpen): print(f"❌ Error {label}: {e}")
+
+def fetch_google_places(query, cell=None, type_search="general"):
+    """Consulta a Google sin depender de la petición (se puede correr en segundo plano).
+
+    Devuelve los resultados con la referencia de la foto; la URL de la imagen se arma
+    después, por petición. Lanza excepción si Google falla, para no guardar el error en caché.
+    """
+    base_url = GOOGLE_PLACES_BASE_URL
+    if cell:
+        radius = 2000 if type_search == "utility" else 8000
+        url = f"{base_url}/nearbysearch/json?keyword={query}&location={cell[0]:.4f},{cell[1]:.4f}&radius={radius}&language=es&key={GOOGLE_API_KEY}"
+    else:
+        suffix = "Mexico" if "campeche" in query.lower() else "Campeche Mexico"
+        safe_query = f"{query} {suffix}"
+        url = f"{base_url}/textsearch/json?query={safe_query}&language=es&key={GOOGLE_API_KEY}"
+
+    data = google_get_json("nearbysearch" if cell else "textsearch", url)
+
     results = []
+    limit = 5 if type_search == "utility" else 4
+    for place in data.get("results", [])[:limit]:
+        p_lat = place["geometry"]["location"]["lat"]
+        p_lng = place["geometry"]["location"]["lng"]
+        photos = place.get("photos") or []
+        results.append({
+            "place_id": place.get("place_id"),
+            "nombre": place.get("name"),
+            "direccion": place.get("vicinity") or place.get("formatted_address"),
+            "rating": place.get("rating", "N/A"),
+            "abierto_ahora": place.get("opening_hours", {}).get("open_now", None),
+            "origen": f"Google Places ({type_search}) 🟢",
+            "photo_ref": photos[0].get("photo_reference") if photos else None,
+            "maps_url": generate_maps_link(p_lat, p_lng, place.get("name"), ""),
+            "coordenadas": {"lat": p_lat, "lng": p_lng},
+            "types": place.get("types", [])
+        })
+    return results
 
+def snap_width(width):
+    """El ancho canónico más chico que cubre `width` (o el más grande si lo pasa)."""
+    if not width: return PHOTO_DEFAULT_WIDTH
+    return next((w for w in PHOTO_WIDTHS if w >= width), PHOTO_WIDTHS[-1])
+
+def photo_warm_widths():
+    """Los anchos que de verdad se piden: los de PHOTO_VIEWS ajustados a PHOTO_WIDTHS (o PHOTO_WARM_WIDTHS)."""
+    if os.getenv("PHOTO_WARM_WIDTHS"):
+        return tuple(snap_width(int(w)) for w in os.getenv("PHOTO_WARM_WIDTHS").split(","))
+    return tuple(sorted({snap_width(css * dpr) for css, dpr in PHOTO_VIEWS.values()}))
+
+PHOTO_WARM_WIDTHS = photo_warm_widths()
+
+def photo_url(photo_ref, width=None):
+    """URL del proxy de imágenes para esta petición (depende del host que la recibió)."""
+    if not photo_ref: return "NO_IMAGE"
     try:
-        if lat and lng:
-            radius = 2000 if type_search == "utility" else 8000
-            url = f"{base_url}/nearbysearch/json?keyword={query}&location={lat},{lng}&radius={radius}&language=es&key={GOOGLE_API_KEY}"
-        else:
-            suffix = "Mexico" if "campeche" in query.lower() else "Campeche Mexico"
-            safe_query = f"{query} {suffix}"
-            url = f"{base_url}/textsearch/json?query={safe_query}&language=es&key={GOOGLE_API_KEY}"
-
-        response = requests.get(url)
-        data = response.json()
-
-        if "results" in data:
-            limit = 5 if type_search == "utility" else 4
-            for place in data["results"][:limit]:
-                p_lat = place["geometry"]["location"]["lat"]
-                p_lng = place["geometry"]["location"]["lng"]
-                
-                photo_url = "NO_IMAGE"
-                if "photos" in place and len(place["photos"]) > 0:
-                    try:
-                        host_url = request.host_url.rstrip('/')
-                        photo_ref = place["photos"][0]["photo_reference"]
-                        photo_url = f"{host_url}/image_proxy?ref={photo_ref}"
-                    except: pass
-
-                place_data = {
-                    "place_id": place.get("place_id"),
-                    "nombre": place.get("name"),
-                    "direccion": place.get("vicinity") or place.get("formatted_address"),
-                    "rating": place.get("rating", "N/A"),
-                    "abierto_ahora": place.get("opening_hours", {}).get("open_now", None),
-                    "origen": f"Google Places ({type_search}) 🟢",
-                    "imagen": photo_url,
-                    "maps_url": generate_maps_link(p_lat, p_lng, place.get("name"), ""),
-                    "types": place.get("types", [])
-                }
-                results.append(place_data)
-    except Exception as e:
-        print(f"❌ Error Google Search: {e}")
+        url = f"{request.host_url.rstrip('/')}/image_proxy?ref={photo_ref}"
+    except RuntimeError:  # fuera de una petición
+        return "NO_IMAGE"
+    return url if width is None else f"{url}&w={width}"
 
-    return results
+def photo_variants(photo_ref):
+    """Todas las variantes de la foto, {ancho: url} (como un srcset), para que el cliente elija."""
+    if not photo_ref or photo_url(photo_ref) == "NO_IMAGE": return {}
+    return {str(w): photo_url(photo_ref, w) for w in PHOTO_WIDTHS}
+
+def search_google_places(query, lat=None, lng=None, type_search="general"):
+    if not GOOGLE_API_KEY: return []
+    cell = geocell(lat, lng)
+    key = (normalize_name(query), type_search, cell)
+    try:
+        raw = GOOGLE_SEARCH_CACHE.get_or_load(key, lambda: fetch_google_places(query, cell, type_search))
+    except Exception as e:
+        log_google_error("Google Search", e)
+        return []
+
+    return [render_google_place(item) for item in raw]
+
+def render_google_place(item):
+    """Copia para la respuesta con las URLs de la foto de esta petición (lo guardado no se toca)."""
+    place_data = {k: v for k, v in item.items() if k != "photo_ref"}
+    place_data["imagen"] = photo_url(item["photo_ref"])
+    place_data["imagenes"] = photo_variants(item["photo_ref"])
+    return place_data
+
+# Campos que se piden a Google por cada parte del caché de detalles
+DETAILS_FIELDS = {"static": "name,rating,formatted_address,photos,geometry", "hours": "opening_hours"}
+
+def fetch_google_place_details(place_id, parts):
+    """Pide a Google solo los campos de las partes indicadas: {parte: datos}."""
+    fields = ",".join(DETAILS_FIELDS[p] for p in parts)
+    url = f"{GOOGLE_PLACES_BASE_URL}/details/json?place_id={place_id}&fields={fields}&language=es&key={GOOGLE_API_KEY}"
+    data = google_get_json("details", url)
+    if "result" not in data:
+        raise RuntimeError(f"Google Places respondió {data.get('status')}")
+    res = data["result"]
+
+    fresh = {}
+    if "static" in parts:
+        photos = res.get("photos") or []
+        fresh["static"] = {
+            "nombre": res.get("name"),
+            "direccion": res.get("formatted_address"),
+            "rating": res.get("rating", "N/A"),
+            "photo_ref": photos[0].get("photo_reference") if photos else None,
+            "coordenadas": res["geometry"]["location"]
+        }
+    if "hours" in parts:
+        fresh["hours"] = {
+            "abierto_ahora": res.get("opening_hours", {}).get("open_now", None),
+            "horario_texto": res.get("opening_hours", {}).get("weekday_text", [])
+        }
+    return fresh
+
+def google_place_parts(place_id, wanted=tuple(DETAILS_FIELDS)):
+    """Partes de los detalles del lugar: del caché en disco; a Google solo se piden las vencidas."""
+    cached = PLACE_DETAILS_CACHE.get(place_id)
+    parts = {part: data for part, (data, _) in cached.items()}
+    stale = [part for part in wanted if not cached.get(part, (None, False))[1]]
+    if stale:
+        def fetch():
+            fresh = fetch_google_place_details(place_id, stale)
+            PLACE_DETAILS_CACHE.put(place_id, fresh)
+            return fresh
+        try:
+            # Aperturas simultáneas del mismo lugar hacen una sola llamada
+            parts.update(FLIGHTS.do(("details", place_id, tuple(stale)), fetch))
+        except Exception as e:
+            # Si Google falla se usa lo guardado aunque esté vencido
+            log_google_error("Google Details", e)
+    return parts
 
 def get_google_place_details(place_id):
     if not GOOGLE_API_KEY: return {}
-    url = f"https://maps.googleapis.com/maps/api/place/details/json?place_id={place_id}&fields=name,rating,formatted_address,opening_hours,photos,geometry&language=es&key={GOOGLE_API_KEY}"
+    parts = google_place_parts(place_id)
+    static = parts.get("static")
+    if not static: return {}
+    hours = parts.get("hours", {})
+    return {
+        "nombre": static["nombre"],
+        "direccion": static["direccion"],
+        "rating": static["rating"],
+        "abierto_ahora": hours.get("abierto_ahora", None),
+        "horario_texto": hours.get("horario_texto", []),
+        "imagen": photo_url(static["photo_ref"]),
+        "imagenes": photo_variants(static["photo_ref"]),
+        "coordenadas": static["coordenadas"]
+    }
+
+def open_google_photo(ref, width):
+    """Abre la descarga de la foto en Google (stream); None si no hay foto. Cobra una llamada."""
+    google_url = f"{GOOGLE_PLACES_BASE_URL}/photo?maxwidth={width}&photo_reference={ref}&key={GOOGLE_API_KEY}"
+    def download():
+        resp = http_client.get(google_url, stream=True)
+        if resp.status_code >= 500:
+            resp.close()
+            raise RuntimeError(f"Google Photos respondió {resp.status_code}")
+        return resp
+    resp = google_call("photo", download)
+    if resp.status_code != 200:
+        resp.close()
+        return None
+    return resp
+
+def place_memo_key(place_name, local_place, lat, lng):
+    """Llave con la que se recuerda el place_id de Google de un nombre buscado."""
+    if local_place: return f"local:{local_place.id}"
+    return f"{normalize_name(place_name)}|{geocell(lat, lng)}"
+
+# -----------------------------
+# PRECALENTADO DE FOTOS
+# -----------------------------
+# Al arrancar y tras cada recarga del catálogo, un hilo baja al disco las fotos
+# que el explorador va a pedir primero: las de los lugares del catálogo con
+# place_id conocido y las de las búsquedas de Google usadas más recientemente.
+# Pocas descargas a la vez y sin pasar de una parte del presupuesto diario,
+# para no quitarle cupo a las peticiones de los usuarios.
+PHOTO_WARM_STATUS = {"status": "idle", "started_at": None, "finished_at": None, "last": {}}
+
+def warm_budget_left():
+    """True mientras el gasto de hoy no pase de la parte del presupuesto reservada al precalentado."""
+    if not BUDGET.daily_limit: return True
+    return BUDGET.today_cost() < BUDGET.daily_limit * PHOTO_WARM_BUDGET_SHARE
+
+def photo_warm_refs():
+    """Referencias de fotos a precalentar, sin repetir: catálogo primero y luego búsquedas recientes."""
+    refs = []
+    catalog = CATALOG
+    for place in chain(*(catalog.in_grupo(g) for g in ("restaurantes_famosos", "municipios_data", "lugares_comunidad"))):
+        if len(refs) >= PHOTO_WARM_MAX_PLACES: break
+        place_id = place.data.get("place_id") or PLACE_DETAILS_CACHE.resolved_id(
+            place_memo_key(place.nombre, place, None, None), PLACE_ID_MEMO_TTL)
+        # Sin place_id no se busca (costaría una búsqueda por lugar); se resuelve cuando alguien lo abre
+        if not place_id or not warm_budget_left(): continue
+        static = google_place_parts(place_id, ("static",)).get("static")
+        if static and static.get("photo_ref"): refs.append(static["photo_ref"])
+    for results in GOOGLE_SEARCH_CACHE.values():
+        refs.extend(item["photo_ref"] for item in results if item.get("photo_ref"))
+    return list(dict.fromkeys(refs))[:PHOTO_WARM_MAX_PLACES]
+
+def warm_photo(ref, width):
+    """Deja una variante en el caché de fotos. Devuelve qué pasó (para el resumen)."""
+    key = PhotoCache.key(ref, width)
+    if key in PHOTO_CACHE or not PHOTO_CACHE.claim(key): return "cached"
+    resp = None
     try:
-        response = requests.get(url)
-        data = response.json()
-        if "result" in data:
-            res = data["result"]
-            photo_url = "NO_IMAGE"
-            if "photos" in res and len(res["photos"]) > 0:
-                try:
-                    host_url = request.host_url.rstrip('/')
-                    photo_ref = res["photos"][0]["photo_reference"]
-                    photo_url = f"{host_url}/image_proxy?ref={photo_ref}"
-                except: pass
-
-            return {
-                "nombre": res.get("name"),
-                "direccion": res.get("formatted_address"),
-                "rating": res.get("rating", "N/A"),
-                "abierto_ahora": res.get("opening_hours", {}).get("open_now", None),
-                "horario_texto": res.get("opening_hours", {}).get("weekday_text", []),
-                "imagen": photo_url,
-                "coordenadas": res["geometry"]["location"]
-            }
-    except: pass
-    return {}
+        if not warm_budget_left(): return "budget"
+        resp = open_google_photo(ref, width)
+        if resp is None: return "missing"
+        for _ in PHOTO_CACHE.tee(key, resp.iter_content(PHOTO_CHUNK_BYTES), resp.headers.get("Content-Type", "image/jpeg")):
+            pass
+        return "warmed"
+    except BudgetExceeded:
+        return "budget"
+    except CircuitOpen:
+        return "breaker"
+    except Exception as e:
+        print(f"⚠️ No se pudo precalentar la foto {ref[:12]}…: {e}")
+        return "error"
+    finally:
+        if resp is not None: resp.close()
+        PHOTO_CACHE.release(key)
+
+def warm_photos():
+    PHOTO_WARM_STATUS.update(status="running", started_at=datetime.now().isoformat(timespec="seconds"))
+    refs = photo_warm_refs()
+    stop = threading.Event()  # sin presupuesto o con Google caído no tiene caso seguir
+
+    def job(args):
+        if stop.is_set(): return "skipped"
+        outcome = warm_photo(*args)
+        if outcome in ("budget", "breaker"): stop.set()
+        return outcome
+
+    jobs = [(ref, width) for ref in refs for width in PHOTO_WARM_WIDTHS]
+    with ThreadPoolExecutor(max_workers=PHOTO_WARM_CONCURRENCY, thread_name_prefix="photo-warm") as pool:
+        outcomes = Counter(pool.map(job, jobs))
+    PHOTO_WARM_STATUS.update(status="ok", finished_at=datetime.now().isoformat(timespec="seconds"),
+                             last=dict(outcomes, photos=len(refs)))
+    if outcomes["warmed"]:
+        print(f"🖼️ Fotos precalentadas: {outcomes['warmed']} nuevas, {outcomes['cached']} ya estaban.")
+
+def photo_warm_loop():
+    """Hilo de fondo: precalienta cada vez que se instala un catálogo (arranque y recargas)."""
+    while True:
+        PHOTO_WARM_REQUEST.wait()
+        PHOTO_WARM_REQUEST.clear()
+        try:
+            warm_photos()
+        except Exception as e:
+            PHOTO_WARM_STATUS["status"] = "error"
+            print(f"❌ Error precalentando fotos: {e}")
+
+# -----------------------------
+# /DESTINATIONS PRECALCULADO (ver destinations.py)
+# -----------------------------
+DESTINATION_POOLS = DestinationPools(os.getenv("DESTINATIONS_POOLS_PATH", os.path.join(NAAJ_STATE_DIR, "destinations_pools.json")))
+DESTINATION_POOLS.reload()
+DESTINATIONS_SNAPSHOT = DestinationsSnapshot(CATALOG, DESTINATION_POOLS.pools)
+DESTINATIONS_STATUS = {"status": "pending", "pools_fetched_at": None, "built_at": None}
+
+def refresh_destination_pools():
+    """Renueva los pools de Google si vencieron. Solo un proceso los pide; los demás leen el archivo."""
+    if DESTINATION_POOLS.reload() or DESTINATION_POOLS.age() < DESTINATIONS_REFRESH_SECONDS:
+        return
+    if not GOOGLE_API_KEY: return
+    with file_lock(DESTINATION_POOLS.path + ".lock", blocking=False) as acquired:
+        if not acquired or DESTINATION_POOLS.reload(): return
+        pools, failed = {}, 0
+        for category in DESTINATION_CATEGORIES:
+            try:
+                pools[category] = fetch_google_places(category, None, "general")
+            except Exception as e:
+                failed += 1
+                log_google_error(f"pool de destinos '{category}'", e)
+                if category in DESTINATION_POOLS.pools: pools[category] = DESTINATION_POOLS.pools[category]
+        if failed == len(DESTINATION_CATEGORIES) and DESTINATION_POOLS.pools:
+            return  # Google no respondió nada: se conserva lo anterior y se reintenta en la siguiente vuelta
+        DESTINATION_POOLS.save(pools)
+        print(f"🧭 Pools de /destinations renovados ({len(pools)} categorías).")
+
+def rebuild_destinations():
+    global DESTINATIONS_SNAPSHOT
+    DESTINATIONS_SNAPSHOT = DestinationsSnapshot(CATALOG, DESTINATION_POOLS.pools)
+    DESTINATIONS_STATUS.update(built_at=datetime.now().isoformat(timespec="seconds"),
+                               pools_fetched_at=datetime.fromtimestamp(DESTINATION_POOLS.fetched_at).isoformat(timespec="seconds")
+                               if DESTINATION_POOLS.fetched_at else None)
+
+def destinations_loop():
+    """Hilo de fondo: rearma /destinations cuando cambia el catálogo y renueva los pools cuando vencen."""
+    while True:
+        try:
+            refresh_destination_pools()
+            DESTINATIONS_DIRTY.clear()
+            rebuild_destinations()
+            DESTINATIONS_STATUS["status"] = "ok"
+        except Exception as e:
+            DESTINATIONS_STATUS["status"] = "error"
+            print(f"❌ Error armando /destinations: {e}")
+        # Revisa de vez en cuando si otro worker renovó los pools
+        DESTINATIONS_DIRTY.wait(min(DESTINATIONS_REFRESH_SECONDS, 300))
+
+# -----------------------------
+# HILOS DE FONDO
+# -----------------------------
+# Los hilos no pasan al hacer fork y un candado tomado por uno de ellos en el
+# maestro quedaría tomado para siempre en el worker. Con gunicorn (preload_app)
+# nada arranca en el maestro: cada worker arranca los suyos en post_fork (ver
+# gunicorn.conf.py, que define NAAJ_BACKGROUND_IN_WORKERS). Sin gunicorn
+# arrancan al importar.
+_background_pid = None
+
+def start_background_threads():
+    """Recarga del documento base, precalentado de fotos y conexiones y /destinations (una vez por proceso)."""
+    global _background_pid
+    if _background_pid == os.getpid(): return
+    _background_pid = os.getpid()
+    # Lo que quedó pendiente de subir o compactar de una corrida anterior
+    if (cloud_enabled and REVIEW_LOG.seq > REVIEW_LOG.uploaded_seq) or REVIEW_LOG.needs_compaction():
+        SAVER.mark_dirty()
+    if STORAGE.remote or DATASET_REFRESH_SECONDS > 0:
+        threading.Thread(target=dataset_refresh_loop, name="dataset-refresh", daemon=True).start()
+    if GOOGLE_API_KEY and PHOTO_WARM_CONCURRENCY > 0:
+        threading.Thread(target=photo_warm_loop, name="photo-warm", daemon=True).start()
+    threading.Thread(target=destinations_loop, name="destinations", daemon=True).start()
+    prewarm_connections()
+
+def _after_fork():
+    # Por si el fork llega con un hilo del padre dentro de DATA_LOCK o a media señal
+    global DATA_LOCK, PHOTO_WARM_REQUEST, DESTINATIONS_DIRTY
+    DATA_LOCK = threading.RLock()
+    PHOTO_WARM_REQUEST, DESTINATIONS_DIRTY = copy_event(PHOTO_WARM_REQUEST), copy_event(DESTINATIONS_DIRTY)
+
+def copy_event(event):
+    fresh = threading.Event()
+    if event.is_set(): fresh.set()
+    return fresh
+
+os.register_at_fork(after_in_child=_after_fork)
+if os.getenv("NAAJ_BACKGROUND_IN_WORKERS") != "1":
+    start_background_threads()
 
 # -----------------------------
 # 4. PROXY Y ENDPOINTS
 # -----------------------------
+@app.before_request
+def sync_workers():
+    # Cada worker se pone al día con la bitácora compartida antes de responder
+    sync_state()
+
+@app.route("/ready", methods=["GET"])
+@cross_origin()
+def ready():
+    """Disponibilidad y versión del dataset que está sirviendo este proceso."""
+    return jsonify({
+        "ready": True,
+        "source": REVIEW_LOG.base,
+        "version": CATALOG.data.get("version"),
+        "base_version": REVIEW_LOG.base_version,
+        "seq": REVIEW_LOG.seq,
+        "snapshot_seq": REVIEW_LOG.snapshot_seq,
+        "loaded_at": DATASET_LOADED_AT,
+        "refresh": DATASET_REFRESH,
+        "caches": {"google_search": GOOGLE_SEARCH_CACHE.stats(), "place_details": PLACE_DETAILS_CACHE.stats(),
+                   "single_flight": FLIGHTS.stats()}
+    })
+
+@app.route("/metrics", methods=["GET"])
+@cross_origin()
+def metrics():
+    """Contadores para tableros: gasto en Google, breakers, cachés y llamadas coalescidas."""
+    return jsonify({
+        "google_budget": BUDGET.stats(),
+        "breakers": breakers_stats(),
+        "caches": {"google_search": GOOGLE_SEARCH_CACHE.stats(), "place_details": PLACE_DETAILS_CACHE.stats(),
+                   "photos": PHOTO_CACHE.stats(), "single_flight": FLIGHTS.stats()},
+        "photo_warm": PHOTO_WARM_STATUS,
+        "destinations": DESTINATIONS_STATUS,
+        "dataset": {"source": REVIEW_LOG.base, "seq": REVIEW_LOG.seq, "uploaded_seq": REVIEW_LOG.uploaded_seq}
+    })
+
+def photo_headers(response, key):
+    """Las variantes de una foto no cambian: el navegador y la CDN las guardan sin volver a preguntar."""
+    response.set_etag(key)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = int(PHOTO_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/image_proxy')
 @cross_origin()
 def image_proxy():
     ref = request.args.get('ref')
-    fallback = "https://images.unsplash.com/photo-1596130152098-93e71bf4b274?w=500&q=80"
-    if not ref: return redirect(fallback)
-    
-    google_url = f"https://maps.googleapis.com/maps/api/place/photo?maxwidth=400&photo_reference={ref}&key={GOOGLE_API_KEY}"
+    if not ref: return redirect(PHOTO_FALLBACK)
+    width = snap_width(request.args.get('w', type=int))
+    key = PhotoCache.key(ref, width)
+    if request.if_none_match.contains(key):
+        return photo_headers(Response(status=304), key)
+
+    # Del disco si ya está; si otra petición la está bajando, se espera a que termine
+    cached = PHOTO_CACHE.lookup(key)
+    if cached is None and not PHOTO_CACHE.claim(key):
+        cached = PHOTO_CACHE.lookup(key)
+        if cached is None: return redirect(PHOTO_FALLBACK)
+    if cached:
+        path, mimetype = cached
+        return photo_headers(send_file(path, mimetype=mimetype, conditional=True, max_age=PHOTO_MAX_AGE), key)
+    if request.method == "HEAD":
+        # Un HEAD no paga una descarga que nadie va a leer
+        PHOTO_CACHE.release(key)
+        return redirect(PHOTO_FALLBACK)
+
     try:
-        resp = requests.get(google_url, stream=True)
-        if resp.status_code == 200:
-            return Response(resp.content, mimetype=resp.headers.get('Content-Type'))
-        else: return redirect(fallback)
-    except: return redirect(fallback)
+        # Sin presupuesto o con el circuito abierto se muestra la imagen de respaldo
+        resp = open_google_photo(ref, width)
+    except Exception as e:
+        log_google_error("Google Photos", e)
+        resp = None
+    if resp is None:
+        PHOTO_CACHE.release(key)
+        return redirect(PHOTO_FALLBACK)
+
+    # Los pedazos van directo al cliente y a la vez al disco (sin juntar la foto en memoria)
+    mimetype = resp.headers.get("Content-Type", "image/jpeg")
+    body = PHOTO_CACHE.tee(key, resp.iter_content(PHOTO_CHUNK_BYTES), mimetype)
+    response = Response(body, mimetype=mimetype)
+    response.call_on_close(resp.close)
+    response.call_on_close(lambda: PHOTO_CACHE.release(key))  # por si el cuerpo nunca se leyó (HEAD)
+    return photo_headers(response, key)
 
 @app.route("/place_details", methods=["GET"])
 @cross_origin()
@@ -227,53 +855,71 @@ def get_place_details():
         lng = request.args.get('lng')
         if not place_name: return jsonify({"error": "Falta nombre"}), 400
 
-        local_data = None
-        all_lists = list(CAMPECHE_DATA.get("restaurantes_famosos", []))
-        all_lists.extend(CAMPECHE_DATA.get("lugares_comunidad", []))
-        for m_data in CAMPECHE_DATA.get("municipios_data", {}).values():
-            all_lists.extend(m_data.get("lugares", []))
-        for cat in CAMPECHE_DATA.get("puntos_interes_recomendados", {}).values():
-            all_lists.extend(cat)
-
-        for place in all_lists:
-            if place["nombre"].lower().strip() == place_name.lower().strip():
-                local_data = place
-                break
+        local_place = CATALOG.find(place_name)
+        local_data = local_place.data if local_place else None
 
+        # Con un place_id conocido (guardado en el lugar o resuelto antes) se va
+        # directo a Details: una sola llamada en vez de búsqueda + detalles
         google_details = {}
-        search_results = search_google_places(place_name, lat, lng)
-        if search_results:
-            best_match = search_results[0]
-            place_id = best_match.get("place_id")
-            if place_id:
-                google_details = get_google_place_details(place_id)
-            else:
-                google_details = best_match
-
+        memo_key = place_memo_key(place_name, local_place, lat, lng)
+        place_id = (local_data or {}).get("place_id") or PLACE_DETAILS_CACHE.resolved_id(memo_key, PLACE_ID_MEMO_TTL)
+        if place_id:
+            google_details = get_google_place_details(place_id)
+        if not google_details:
+            if local_place and local_place.lat is not None:
+                lat, lng = local_place.lat, local_place.lng  # se busca junto al lugar, no junto al usuario
+            search_results = search_google_places(place_name, lat, lng)
+            if search_results:
+                best_match = search_results[0]
+                place_id = best_match.get("place_id")
+                if place_id:
+                    PLACE_DETAILS_CACHE.remember_id(memo_key, place_id)
+                    google_details = get_google_place_details(place_id)
+                else:
+                    google_details = best_match
+
+        google_image = google_details.get("imagen") not in (None, "NO_IMAGE")
         response_data = {
             "nombre": local_data.get("nombre") if local_data else google_details.get("nombre", place_name),
-            "direccion": google_details.get("direccion") or local_data.get("direccion", "Dirección no disponible"),
-            "imagen": google_details.get("imagen") if google_details.get("imagen") != "NO_IMAGE" else local_data.get("imagen", "NO_IMAGE"),
+            "direccion": google_details.get("direccion") or (local_data or {}).get("direccion", "Dirección no disponible"),
+            "imagen": google_details["imagen"] if google_image else (local_data or {}).get("imagen", "NO_IMAGE"),
+            "imagenes": google_details.get("imagenes", {}) if google_image else {},
             "abierto_ahora": google_details.get("abierto_ahora", None),
             "horario_texto": google_details.get("horario_texto", []),
-            "reviews": local_data.get("reviews", []) if local_data else []
         }
+        # Solo agregados + primera página; el resto se pide a /places/<naaj_id>/reviews.
+        # naaj_id es el id del catálogo (no el place_id de Google)
+        if local_place:
+            page, next_cursor = local_place.reviews_page(limit=REVIEWS_PAGE_SIZE)
+            response_data.update(naaj_id=local_place.id, reviews=page, reviews_next_cursor=next_cursor,
+                                 review_stats=local_place.stats.as_dict())
+        else:
+            response_data.update(naaj_id=None, reviews=[], reviews_next_cursor=None, review_stats=None)
 
         naaj_rating = local_data.get("rating", 0) if local_data else 0
-        if len(response_data["reviews"]) >= 5:
+        if local_place and local_place.stats.count >= 5:
             response_data["rating"] = naaj_rating
             response_data["rating_source"] = "Comunidad Naaj 🦎"
         else:
             response_data["rating"] = google_details.get("rating", "N/A")
             response_data["rating_source"] = "Google Places 🟢"
 
-        response_data["reviews"].sort(key=lambda x: x.get("date", ""), reverse=True)
-        response_data["reviews"] = response_data["reviews"][:10]
-
         return jsonify(response_data)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/places/<naaj_id>/reviews", methods=["GET"])
+@cross_origin()
+def get_place_reviews(naaj_id):
+    """Reseñas de un lugar del catálogo paginadas con cursor: ?cursor=...&limit=..."""
+    place = CATALOG.get(naaj_id)
+    if not place: return jsonify({"error": "Lugar no encontrado"}), 404
+    limit = min(max(request.args.get("limit", REVIEWS_PAGE_SIZE, type=int), 1), REVIEWS_MAX_PAGE_SIZE)
+    cursor = request.args.get("cursor", type=int)
+    page, next_cursor = place.reviews_page(cursor, limit)
+    return jsonify({"naaj_id": place.id, "reviews": page, "next_cursor": next_cursor,
+                    "review_stats": place.stats.as_dict()})
+
 @app.route("/review", methods=["POST"])
 @cross_origin()
 def add_review():
@@ -288,57 +934,38 @@ def add_review():
 
         if not place_name: return jsonify({"error": "Faltan datos"}), 400
 
-        global CAMPECHE_DATA
-        
-        target_place = None
-        all_lists = [CAMPECHE_DATA.get("restaurantes_famosos", []), CAMPECHE_DATA.get("lugares_comunidad", [])]
-        for m in CAMPECHE_DATA.get("municipios_data", {}).values(): all_lists.append(m.get("lugares", []))
-        for c in CAMPECHE_DATA.get("puntos_interes_recomendados", {}).values(): all_lists.append(c)
-
-        for lst in all_lists:
-            for p in lst:
-                if p["nombre"] == place_name:
-                    target_place = p
-                    break
-            if target_place: break
-
-        if not target_place:
-            print(f"🆕 Nuevo lugar: {place_name}")
-            new_place = {
+        # Agregar reseña con fecha local
+        entry = {
+            "op": "review",
+            "place_name": place_name,
+            "new_place": {
                 "nombre": place_name,
                 "categoria": category,
                 "direccion": address,
                 "coordenadas": coords,
                 "rating": user_rating,
-                "reviews": [],
                 "origen": "Comunidad 👥",
                 "imagen": "NO_IMAGE"
+            },
+            "review": {
+                "id": uuid.uuid4().hex,
+                "user": "Viajero Explorador",
+                "rating": user_rating,
+                "comment": comment,
+                "date": get_mexico_time().strftime("%Y-%m-%d %H:%M")
             }
-            # Asegurarse de que la lista exista
-            if "lugares_comunidad" not in CAMPECHE_DATA:
-                CAMPECHE_DATA["lugares_comunidad"] = []
-            
-            CAMPECHE_DATA["lugares_comunidad"].append(new_place)
-            target_place = new_place
-
-        # Agregar reseña con fecha local
-        new_review = {
-            "user": "Viajero Explorador",
-            "rating": user_rating,
-            "comment": comment,
-            "date": get_mexico_time().strftime("%Y-%m-%d %H:%M")
         }
-        
-        if "reviews" not in target_place: target_place["reviews"] = []
-        target_place["reviews"].insert(0, new_review)
-
-        vals = [r["rating"] for r in target_place["reviews"]]
-        target_place["rating"] = round(sum(vals) / len(vals), 1)
-
-        # 🆕 GUARDADO EN LA NUBE (JSONBin)
-        save_data_cloud(CAMPECHE_DATA)
+        # Una línea en la bitácora (O(1)); el documento se sube después en segundo plano
+        with DATA_LOCK:
+            REVIEW_LOG.append(entry, apply_entry)
+            if REVIEW_LOG.needs_reload:
+                reload_state()  # ya incluye esta reseña (está en la bitácora)
+                new_rating = CATALOG.find(place_name).data["rating"]
+            else:
+                new_rating = apply_review(entry)
+        SAVER.mark_dirty()
 
-        return jsonify({"message": "Guardado", "new_rating": target_place["rating"]})
+        return jsonify({"message": "Guardado", "new_rating": new_rating})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -356,116 +983,39 @@ def get_destinations():
     try:
         lat = request.args.get('lat', type=float)
         lng = request.args.get('lng', type=float)
-        
-        all_places = list(CAMPECHE_DATA.get("restaurantes_famosos", []))
-        for m_data in CAMPECHE_DATA.get("municipios_data", {}).values():
-            all_places.extend(m_data.get("lugares", []))
-        all_places.extend(CAMPECHE_DATA.get("lugares_comunidad", []))
-        
-        categories = ["cafeterias bonitas", "tacos populares", "parques tranquilos", "museos", "cenas romanticas", "comida regional"]
-        random_cat = random.choice(categories)
-        
-        google_fresh = search_google_places(random_cat, lat, lng)
-        
-        combined = all_places + google_fresh
-        unique_places = {p['nombre']: p for p in combined}.values()
-        final_list = list(unique_places)
-        
-        popular = sorted(final_list, key=lambda x: float(x.get("rating", 0)), reverse=True)[:8]
-        
+
+        # Todo viene precalculado en segundo plano: aquí no hay red ni se ordena el catálogo
+        snapshot = DESTINATIONS_SNAPSHOT
+        view = snapshot.pick(RNG)
         if lat and lng:
-            for p in final_list:
-                coords = p.get("coordenadas") or {}
-                if coords.get('lat'): p["_d"] = haversine(lat, lng, coords['lat'], coords['lng'])
-                else: p["_d"] = 9999
-            suggested = sorted(final_list, key=lambda x: x.get("_d", 9999))[:8]
+            suggested = snapshot.suggested(view, lat, lng)
         else:
-            pool = list(final_list)
-            random.shuffle(pool)
-            suggested = pool[:8]
+            suggested = RNG.sample(view.merged, min(8, len(view.merged)))
 
-        return jsonify({"popular": popular, "suggested": suggested})
+        render = lambda p: render_google_place(p) if "photo_ref" in p else p
+        return jsonify({"popular": [render(p) for p in view.popular], "suggested": [render(p) for p in suggested]})
     except Exception as e:
         return jsonify({"popular": [], "suggested": []}), 500
 
-def retrieve_smart_data(query, history=[], lat=None, lng=None):
-    combined_results = []
-    current_keywords = extract_keywords(query)
-    follow_up_words = ["eso", "ese", "cual", "como", "donde", "mas", "barato", "caro", "mejor", "opcion", "otro"]
-    is_follow_up = any(w in query.lower().split() for w in follow_up_words) or len(current_keywords) == 0
-    search_terms = list(current_keywords)
-    
-    if is_follow_up and history:
-        last_user_msg = next((m['text'] for m in reversed(history) if m.get('isUser')), "")
-        last_keywords = extract_keywords(last_user_msg)
-        search_terms = last_keywords + search_terms
-
-    final_query = " ".join(search_terms) if search_terms else query
-    
-    MUNICIPALITIES = ["calakmul", "calkini", "campeche", "candelaria", "carmen", "champoton", "dzitbalche", "escarcega", "hecelchakan", "hopelchen", "palizada", "seybaplaya", "tenabo"]
-    target_municipality = None
-    for mun in MUNICIPALITIES:
-        if mun in final_query.lower():
-            target_municipality = mun
-            lat = None; lng = None
-            break
-
-    utility_words = ["oxxo", "seven", "tienda", "cajero", "banco", "atm", "hospital", "clinica", "medico", "farmacia", "cruz roja", "policia", "seguridad", "gasolinera"]
-    is_utility = any(w in final_query.lower() for w in utility_words)
-
-    if is_utility and lat and lng:
-        return search_google_places(final_query, lat, lng, type_search="utility")
-
-    json_hits = []
-    seen_names = set()
-    lists_to_search = []
-    
-    if target_municipality and "municipios_data" in CAMPECHE_DATA:
-        lists_to_search.extend(CAMPECHE_DATA["municipios_data"].get(target_municipality, {}).get("lugares", []))
-    else:
-        lists_to_search.extend(CAMPECHE_DATA.get("restaurantes_famosos", []))
-        for cat in CAMPECHE_DATA.get("puntos_interes_recomendados", {}).values():
-            lists_to_search.extend(cat)
-    
-    lists_to_search.extend(CAMPECHE_DATA.get("lugares_comunidad", []))
-
-    for item in lists_to_search:
-        full_text = f"{item['nombre']} {item.get('categoria','')} {item.get('direccion','')}".lower()
-        if any(k in full_text for k in search_terms):
-            if "maps_url" not in item:
-                coords = item.get("coordenadas")
-                if coords: item["maps_url"] = generate_maps_link(coords["lat"], coords["lng"], item["nombre"], "")
-                else: item["maps_url"] = generate_maps_link(None, None, item["nombre"], item.get("direccion",""))
-            
-            item["origen"] = "Datos Naaj 🟠"
-            json_hits.append(item)
-            seen_names.add(item["nombre"].lower())
-
-    if lat and lng:
-        for item in json_hits:
-            coords = item.get("coordenadas")
-            if coords: item["_dist"] = haversine(lat, lng, coords["lat"], coords["lng"])
-            else: item["_dist"] = 9999
-        json_hits.sort(key=lambda x: x.get("_dist", 9999))
-
-    combined_results.extend(json_hits[:5])
-
-    google_triggers = ["abierto", "horario", "autobus", "transporte", "ado", "combi", "colectivo", "valoracion", "rating", "precio", "opiniones"]
-    needs_google = len(json_hits) < 2 or any(w in final_query.lower() for w in google_triggers) or target_municipality
-
-    if needs_google and len(final_query) > 2:
-        google_hits = search_google_places(final_query, lat, lng, type_search="general")
-        for g_item in google_hits:
-            if g_item["nombre"].lower() not in seen_names:
-                combined_results.append(g_item)
-    
-    return combined_results or google_hits
+@app.route("/rankings", methods=["GET"])
+@cross_origin()
+def get_rankings():
+    """Mejor calificados: ?municipio=calkini&categoria=mariscos&limit=10 (ambos opcionales)."""
+    municipio = request.args.get("municipio") or None
+    categoria = request.args.get("categoria") or None
+    limit = min(max(request.args.get("limit", RANKINGS_SIZE, type=int), 1), RANKINGS_MAX_SIZE)
+    places = CATALOG.top_rated(limit, municipio=municipio, categoria=categoria)
+    return jsonify({
+        "municipio": municipio, "categoria": categoria,
+        "places": [p.as_result(naaj_id=p.id, review_count=p.stats.count) for p in places],
+    })
 
 # -----------------------------
 # RETRIEVER INTELIGENTE (Con Lógica de Transporte)
 # -----------------------------
 def retrieve_smart_data(query, history=[], lat=None, lng=None):
     combined_results = []
+    catalog = CATALOG  # una sola vista del catálogo aunque se recargue a mitad de la petición
     
     # A. CONTEXTO Y KEYWORDS
     current_keywords = extract_keywords(query)
@@ -483,8 +1033,9 @@ def retrieve_smart_data(query, history=[], lat=None, lng=None):
     # B. DETECCIÓN DE MUNICIPIO
     MUNICIPALITIES = ["calakmul", "calkini", "campeche", "candelaria", "carmen", "champoton", "dzitbalche", "escarcega", "hecelchakan", "hopelchen", "palizada", "seybaplaya", "tenabo"]
     target_municipality = None
+    folded_query = fold_text(final_query)
     for mun in MUNICIPALITIES:
-        if mun in final_query.lower():
+        if mun in folded_query:
             target_municipality = mun
             lat = None; lng = None # Ignorar GPS si busca otro municipio
             break
@@ -502,8 +1053,8 @@ def retrieve_smart_data(query, history=[], lat=None, lng=None):
         municipio_key = target_municipality if target_municipality else "campeche" # Default capital
         
         # Buscar en el JSON específico de transporte
-        if "municipios_data" in CAMPECHE_DATA and municipio_key in CAMPECHE_DATA["municipios_data"]:
-            data_mun = CAMPECHE_DATA["municipios_data"][municipio_key]
+        if "municipios_data" in catalog.data and municipio_key in catalog.data["municipios_data"]:
+            data_mun = catalog.data["municipios_data"][municipio_key]
             if "datos_transporte" in data_mun:
                 transport_info = data_mun["datos_transporte"]
                 # Le damos formato de "Lugar" para que Gemini lo lea fácil
@@ -535,34 +1086,24 @@ def retrieve_smart_data(query, history=[], lat=None, lng=None):
     
     # Si ya tenemos info de transporte, no saturamos con restaurantes, a menos que sea mixto
     if not is_transport_query or len(combined_results) == 0:
-        lists_to_search = []
-        if target_municipality and "municipios_data" in CAMPECHE_DATA:
-            lists_to_search.extend(CAMPECHE_DATA["municipios_data"].get(target_municipality, {}).get("lugares", []))
+        # Búsqueda en el índice invertido del catálogo (sin recorrer todos los lugares)
+        if target_municipality:
+            group_order = {"municipios_data": 0, "lugares_comunidad": 1}
+            where = lambda p: p.municipio == target_municipality or p.grupo == "lugares_comunidad"
         else:
-            lists_to_search.extend(CAMPECHE_DATA.get("restaurantes_famosos", []))
-            for cat in CAMPECHE_DATA.get("puntos_interes_recomendados", {}).values():
-                lists_to_search.extend(cat)
-        lists_to_search.extend(CAMPECHE_DATA.get("lugares_comunidad", []))
-
-        for item in lists_to_search:
-            full_text = f"{item['nombre']} {item.get('categoria','')} {item.get('direccion','')}".lower()
-            if any(k in full_text for k in search_terms):
-                if "maps_url" not in item:
-                    coords = item.get("coordenadas")
-                    if coords: item["maps_url"] = generate_maps_link(coords["lat"], coords["lng"], item["nombre"], "")
-                    else: item["maps_url"] = generate_maps_link(None, None, item["nombre"], item.get("direccion",""))
-                item["origen"] = "Datos Naaj 🟠"
-                json_hits.append(item)
-                seen_names.add(item["nombre"].lower())
-
-        # Ordenar JSON por distancia si hay GPS
+            group_order = {"restaurantes_famosos": 0, "puntos_interes_recomendados": 1, "lugares_comunidad": 2}
+            where = lambda p: p.grupo in group_order
+        hits = sorted(catalog.search(search_terms, where), key=lambda p: group_order[p.grupo])
+
+        # Ordenar por distancia si hay GPS (cálculo vectorizado, sin escribir en los lugares)
         if lat and lng:
-            for item in json_hits:
-                coords = item.get("coordenadas")
-                if coords: item["_dist"] = haversine(lat, lng, coords["lat"], coords["lng"])
-                else: item["_dist"] = 9999
-            json_hits.sort(key=lambda x: x.get("_dist", 9999))
-        
+            hits = [h.place for h in catalog.by_distance(lat, lng, hits)]
+
+        for place in hits:
+            # Copia para la respuesta: la liga de Maps ya viene calculada desde la carga
+            json_hits.append(place.as_result(origen="Datos Naaj 🟠"))
+            seen_names.add(place.nombre.lower())
+
         combined_results.extend(json_hits[:5])
 
     # Google como complemento
@@ -598,7 +1139,7 @@ Context:
 Current Question: "{user_question}"
 
 Data Found:
-{json.dumps(retrieved_data, ensure_ascii=False, indent=2)}
+{json.dumps([{k: v for k, v in r.items() if k != "imagenes"} for r in retrieved_data], ensure_ascii=False, indent=2)}
 
 --- INSTRUCTIONS ---
 
@@ -627,6 +1168,32 @@ Data Found:
    *Note:* For lists, put all addresses in Part 3. Do not break the 3-part structure.
 """
 
+def catalog_answer(results):
+    """Respuesta sin Gemini (caído o lento): los lugares encontrados en el formato de 3 partes."""
+    places = [r for r in results if r.get("nombre")][:5]
+    if not places:
+        return "Ma'alob k'iin 🦎 Ahorita no puedo responder bien, intenta de nuevo en unos minutos."
+    lines = []
+    for p in places:
+        rating = p.get("rating")
+        lines.append(f"• {p['nombre']}" + (f" ({rating} ⭐)" if rating not in (None, "N/A", 0) else ""))
+    image = next((p["imagen"] for p in places if str(p.get("imagen", "")).startswith("http")), "NO_IMAGE")
+    addresses = " ".join(f"{p['nombre']}: {p.get('direccion', '')} {p.get('maps_url', '')}".strip() for p in places)
+    return "Ma'alob k'iin 🦎 Esto encontré para ti:\n" + "\n".join(lines) + f" ||| {image} ||| {addresses}"
+
+def gemini_generate(prompt):
+    """Texto generado por Gemini (API REST por el cliente HTTP compartido: pool, timeout y fixtures)."""
+    url = f"{GEMINI_BASE_URL}/v1beta/models/{GEMINI_MODEL}:generateContent"
+    response = http_client.post(url, headers={"x-goog-api-key": GEMINI_API_KEY or ""},
+                                json={"contents": [{"parts": [{"text": prompt}]}]},
+                                timeout=(3.05, GEMINI_TIMEOUT))
+    if response.status_code != 200:
+        raise RuntimeError(f"Gemini respondió {response.status_code}")
+    candidates = response.json().get("candidates") or []
+    if not candidates:
+        raise RuntimeError("Gemini no devolvió respuesta")
+    return "".join(part.get("text", "") for part in candidates[0].get("content", {}).get("parts", []))
+
 @app.route("/naaj", methods=["POST"])
 def naaj():
     try:
@@ -641,9 +1208,13 @@ def naaj():
         results = retrieve_smart_data(question, history, lat, lng)
         prompt = build_prompt(question, results, "auto", (lat and lng), history)
         
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
-        raw_text = response.text
+        degraded = False
+        try:
+            raw_text = GEMINI_BREAKER.call(lambda: gemini_generate(prompt))
+        except Exception as e:
+            # Circuito abierto, timeout o error: se contesta al instante con los datos propios
+            if not isinstance(e, CircuitOpen): print(f"❌ Error Gemini: {e}")
+            raw_text, degraded = catalog_answer(results), True
 
         messages_to_send = []
         if "|||" in raw_text:
@@ -656,7 +1227,7 @@ def naaj():
         else:
             messages_to_send.append({"type": "text", "content": raw_text})
 
-        return jsonify({"answer": raw_text, "messages": messages_to_send})
+        return jsonify({"answer": raw_text, "messages": messages_to_send, "degraded": degraded})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -0,0 +1,125 @@
+import os
+import time
+import threading
+from collections import deque
+
+# -----------------------------
+# CIRCUIT BREAKERS POR DEPENDENCIA
+# -----------------------------
+# Un breaker por servicio externo (Google, Gemini, JSONBin):
+#   closed     -> las llamadas pasan; se anotan las últimas `window` (error o lenta = falla).
+#   open       -> demasiadas fallas: se rechaza al instante con CircuitOpen durante
+#                 `open_seconds`, y quien llama responde con caché o datos locales.
+#   half_open  -> pasado ese tiempo se deja pasar una llamada de prueba; si sale
+#                 bien se cierra, si no se vuelve a abrir.
+# El estado es por proceso (cada worker aprende por su cuenta).
+
+
+class CircuitOpen(Exception):
+    """El breaker de la dependencia está abierto: no se intentó la llamada."""
+
+
+class CircuitBreaker:
+    """Breaker con umbral de fallas y de latencia sobre una ventana de llamadas recientes."""
+
+    def __init__(self, name, window=20, min_calls=5, failure_ratio=0.5, slow_call_seconds=5.0,
+                 open_seconds=30.0, ignore=()):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls            # no se abre con menos llamadas en la ventana
+        self.failure_ratio = failure_ratio    # fracción de fallas (errores + lentas) que lo abre
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.ignore = tuple(ignore)           # excepciones que no dicen nada de la salud del servicio
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.opened_at = None
+        self._outcomes = deque(maxlen=self.window)  # True = falla
+        self._trial = False  # hay una llamada de prueba en curso (half_open)
+        self.counters = {"calls": 0, "failures": 0, "slow": 0, "rejected": 0, "opened": 0}
+
+    def _before(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    self.counters["rejected"] += 1
+                    raise CircuitOpen(f"{self.name}: circuito abierto")
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._trial:
+                    self.counters["rejected"] += 1
+                    raise CircuitOpen(f"{self.name}: probando si ya responde")
+                self._trial = True
+            self.counters["calls"] += 1
+
+    def _record(self, failed, slow=False):
+        with self._lock:
+            if failed: self.counters["failures"] += 1
+            if slow: self.counters["slow"] += 1
+            bad = failed or slow
+            if self.state == "half_open":
+                self._trial = False
+                if bad:
+                    self._open()
+                else:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                    print(f"✅ Circuito {self.name} cerrado de nuevo.")
+                return
+            self._outcomes.append(bad)
+            if len(self._outcomes) >= self.min_calls and sum(self._outcomes) / len(self._outcomes) >= self.failure_ratio:
+                self._open()
+
+    def _open(self):
+        # Se llama con el candado tomado
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.counters["opened"] += 1
+        print(f"⚠️ Circuito {self.name} abierto por {self.open_seconds:.0f}s: se responde sin llamarlo.")
+
+    def _release(self):
+        with self._lock:
+            if self.state == "half_open": self._trial = False
+
+    def call(self, fn):
+        """Ejecuta fn() a través del breaker. Lanza CircuitOpen sin llamarla si está abierto."""
+        self._before()
+        start = time.monotonic()
+        try:
+            result = fn()
+        except self.ignore:
+            self._release()
+            raise
+        except Exception:
+            self._record(True)
+            raise
+        self._record(False, slow=time.monotonic() - start > self.slow_call_seconds)
+        return result
+
+    def stats(self):
+        with self._lock:
+            retry_in = None
+            if self.state == "open":
+                retry_in = round(max(0.0, self.open_seconds - (time.monotonic() - self.opened_at)), 1)
+            return dict(self.counters, state=self.state, retry_in=retry_in,
+                        window_failures=sum(self._outcomes), window_calls=len(self._outcomes))
+
+
+# Un breaker por dependencia, compartido por todo el proceso
+BREAKERS = {}
+
+
+def breaker(name, **options):
+    """El breaker de `name`; se crea con `options` la primera vez que se pide."""
+    if name not in BREAKERS:
+        BREAKERS[name] = CircuitBreaker(name, **options)
+    return BREAKERS[name]
+
+
+def breakers_stats():
+    return {name: b.stats() for name, b in BREAKERS.items()}
@@ -0,0 +1,162 @@
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+# -----------------------------
+# PRESUPUESTO DE LLAMADAS A GOOGLE
+# -----------------------------
+# Cada llamada de pago pasa primero por aquí:
+#   1. Cubeta de fichas por endpoint (ritmo máximo por proceso).
+#   2. Tope de gasto diario y mensual, contado en un SQLite compartido por
+#      todos los workers, así el tope se respeta aunque haya varios procesos.
+# Si no hay presupuesto se lanza BudgetExceeded y quien llama responde con
+# lo que tenga en caché o con los datos locales.
+
+# USD por llamada (precios de lista de Places API)
+GOOGLE_COSTS = {
+    "textsearch": 0.032,
+    "nearbysearch": 0.032,
+    "details": 0.017,
+    "photo": 0.007,
+}
+
+# (llamadas por segundo, ráfaga máxima) por endpoint
+GOOGLE_RATES = {
+    "textsearch": (5, 10),
+    "nearbysearch": (5, 10),
+    "details": (10, 20),
+    "photo": (20, 40),
+}
+
+BUDGET_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spend (
+    day TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    PRIMARY KEY (day, endpoint)
+);
+"""
+
+
+class BudgetExceeded(Exception):
+    """No hay presupuesto (ritmo o gasto) para la llamada."""
+
+
+class TokenBucket:
+    """Cubeta de fichas: `rate` fichas por segundo, hasta `capacity` acumuladas."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, n=1):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < n:
+                return False
+            self.tokens -= n
+            return True
+
+
+class QuotaBudget:
+    """Presupuesto de APIs de pago: ritmo por endpoint y topes de gasto diario y mensual."""
+
+    def __init__(self, path, costs=GOOGLE_COSTS, rates=GOOGLE_RATES, daily_limit=0, monthly_limit=0):
+        self.path = path
+        self.costs = costs
+        self.rates = rates
+        self.daily_limit = daily_limit      # USD; 0 = sin tope
+        self.monthly_limit = monthly_limit  # USD; 0 = sin tope
+        self.denied = {endpoint: {"rate": 0, "daily": 0, "monthly": 0} for endpoint in costs}
+        self._make_buckets()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(BUDGET_SCHEMA)
+        finally:
+            conn.close()
+        os.register_at_fork(after_in_child=self._make_buckets)
+
+    def _make_buckets(self):
+        self.buckets = {endpoint: TokenBucket(*self.rates[endpoint]) for endpoint in self.costs}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _today():
+        # Días en UTC: así se cuentan igual en todos los servidores
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def spend(self, endpoint):
+        """Cobra una llamada a `endpoint` o lanza BudgetExceeded si no alcanza."""
+        if not self.buckets[endpoint].take():
+            self.denied[endpoint]["rate"] += 1
+            raise BudgetExceeded(f"{endpoint}: límite de ritmo")
+
+        cost = self.costs[endpoint]
+        day = self._today()
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE: revisar y sumar es atómico entre workers
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                daily = conn.execute("SELECT COALESCE(SUM(cost), 0) FROM spend WHERE day = ?", (day,)).fetchone()[0]
+                monthly = conn.execute("SELECT COALESCE(SUM(cost), 0) FROM spend WHERE day LIKE ?",
+                                       (day[:7] + "-%",)).fetchone()[0]
+                if self.daily_limit and daily + cost > self.daily_limit:
+                    self.denied[endpoint]["daily"] += 1
+                    raise BudgetExceeded(f"{endpoint}: tope diario de {self.daily_limit} USD")
+                if self.monthly_limit and monthly + cost > self.monthly_limit:
+                    self.denied[endpoint]["monthly"] += 1
+                    raise BudgetExceeded(f"{endpoint}: tope mensual de {self.monthly_limit} USD")
+                conn.execute(
+                    "INSERT INTO spend (day, endpoint, calls, cost) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT (day, endpoint) DO UPDATE SET calls = calls + 1, cost = cost + excluded.cost",
+                    (day, endpoint, cost))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def today_cost(self):
+        """USD gastados hoy entre todos los procesos."""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COALESCE(SUM(cost), 0) FROM spend WHERE day = ?", (self._today(),)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Llamadas y gasto de hoy y del mes por endpoint, topes y rechazos (para tableros)."""
+        day = self._today()
+        conn = self._connect()
+        try:
+            today = conn.execute("SELECT endpoint, calls, cost FROM spend WHERE day = ?", (day,)).fetchall()
+            month = conn.execute("SELECT endpoint, SUM(calls), SUM(cost) FROM spend WHERE day LIKE ? GROUP BY endpoint",
+                                 (day[:7] + "-%",)).fetchall()
+        finally:
+            conn.close()
+        return {
+            "day": day,
+            "today": {e: {"calls": calls, "cost_usd": round(cost, 4)} for e, calls, cost in today},
+            "month": {e: {"calls": calls, "cost_usd": round(cost, 4)} for e, calls, cost in month},
+            "today_cost_usd": round(sum(c for _, _, c in today), 4),
+            "month_cost_usd": round(sum(c for _, _, c in month), 4),
+            "daily_limit_usd": self.daily_limit,
+            "monthly_limit_usd": self.monthly_limit,
+            "denied": self.denied,
+            "tokens": {e: round(b.tokens, 2) for e, b in self.buckets.items()},
+        }
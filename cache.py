@@ -0,0 +1,390 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# -----------------------------
+# LLAMADAS COALESCIDAS (SINGLE-FLIGHT)
+# -----------------------------
+# Si varias peticiones piden lo mismo al mismo tiempo (la misma búsqueda en
+# Google, la misma foto), solo la primera sale a la red; las demás esperan
+# su resultado (o su error).
+
+
+class SingleFlight:
+    """Une llamadas idénticas concurrentes en una sola."""
+
+    def __init__(self):
+        self._after_fork()
+        self.counters = {"calls": 0, "shared": 0}
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # Las llamadas en curso del padre nunca terminan en el hijo (sus hilos no pasan)
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> Future en curso
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.counters["calls"] += 1
+            else:
+                self.counters["shared"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            value = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, in_flight=len(self._calls))
+
+
+# Compartido por todo el proceso; las llaves llevan un prefijo por tipo de llamada
+FLIGHTS = SingleFlight()
+
+
+# -----------------------------
+# CACHÉ EN MEMORIA (TTL + LRU)
+# -----------------------------
+# Cada entrada vive `ttl` segundos. Ya vencida, todavía se sirve durante
+# `stale_ttl` segundos mientras un hilo de fondo la renueva
+# (stale-while-revalidate). Al pasar de `maxsize` entradas sale la que lleva
+# más tiempo sin usarse. Si la carga falla (p. ej. sin presupuesto), se sirve
+# la última copia aunque ya haya vencido del todo.
+
+
+class TTLCache:
+    """Caché LRU con expiración, renovación en segundo plano y contadores."""
+
+    def __init__(self, maxsize=512, ttl=900, stale_ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()  # key -> (valor, vence, vence_del_todo)
+        self._after_fork()
+        self._flight = SingleFlight()
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "refresh_errors": 0,
+                         "fallbacks": 0}
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    def __len__(self):
+        return len(self._data)
+
+    def set(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (value, now + self.ttl, now + self.ttl + self.stale_ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def get_or_load(self, key, loader):
+        """Valor de la caché o, si no hay, el de loader() (que se guarda). Los errores de loader no se guardan."""
+        now = time.monotonic()
+        fallback = None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires, stale_until = entry
+                if now < expires:
+                    self._data.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return value
+                if now < stale_until:
+                    self._data.move_to_end(key)
+                    self.counters["stale_hits"] += 1
+                    self._refresh(key, loader)
+                    return value
+                fallback = entry
+            self.counters["misses"] += 1
+        # Varios fallos simultáneos de la misma llave esperan una sola carga
+        try:
+            return self._flight.do(key, lambda: self._load(key, loader))
+        except Exception:
+            if fallback is None: raise
+            self.counters["fallbacks"] += 1
+            return fallback[0]
+
+    def _load(self, key, loader):
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def _refresh(self, key, loader):
+        # Se llama con el candado tomado: una sola renovación por llave a la vez
+        if key in self._refreshing: return
+        self._refreshing.add(key)
+
+        def run():
+            try:
+                self.set(key, loader())
+            except Exception as e:
+                self.counters["refresh_errors"] += 1
+                print(f"⚠️ No se pudo renovar la caché ({key}): {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name="cache-refresh", daemon=True).start()
+
+    def values(self):
+        """Valores guardados, del usado más recientemente al más viejo (vencidos incluidos)."""
+        with self._lock:
+            return [value for value, _, _ in reversed(self._data.values())]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["stale_hits"] + self.counters["misses"]
+            hit_ratio = (self.counters["hits"] + self.counters["stale_hits"]) / lookups if lookups else None
+            return dict(self.counters, size=len(self._data), hit_ratio=hit_ratio,
+                        coalesced=self._flight.counters["shared"])
+
+
+# -----------------------------
+# CACHÉ PERSISTENTE DE DETALLES (SQLITE)
+# -----------------------------
+# Los detalles de un lugar de Google se guardan por place_id en partes
+# (p. ej. "static": nombre, dirección, fotos; "hours": horario y abierto
+# ahora), cada una con su propia vigencia. El archivo sobrevive reinicios y
+# lo comparten todos los workers.
+
+DETAILS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS place_details (
+    place_id TEXT NOT NULL,
+    part TEXT NOT NULL,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (place_id, part)
+);
+CREATE TABLE IF NOT EXISTS place_ids (
+    query TEXT PRIMARY KEY,
+    place_id TEXT NOT NULL,
+    resolved_at REAL NOT NULL
+);
+"""
+
+
+class PlaceDetailsCache:
+    """Detalles de lugares por place_id en SQLite, con vigencia por grupo de campos."""
+
+    def __init__(self, path, ttls):
+        self.path = path
+        self.ttls = ttls  # parte -> segundos de vigencia
+        self.counters = {"hits": 0, "partial_hits": 0, "misses": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(DETAILS_SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, place_id):
+        """Partes guardadas del lugar: {parte: (datos, vigente)}. Incluye las vencidas como respaldo."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT part, data, fetched_at FROM place_details WHERE place_id = ?",
+                                (place_id,)).fetchall()
+        finally:
+            conn.close()
+        parts = {part: (json.loads(data), now - fetched_at < self.ttls.get(part, 0))
+                 for part, data, fetched_at in rows}
+        fresh = sum(1 for _, ok in parts.values() if ok)
+        if fresh == len(self.ttls): self.counters["hits"] += 1
+        elif fresh: self.counters["partial_hits"] += 1
+        else: self.counters["misses"] += 1
+        return parts
+
+    def put(self, place_id, parts):
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO place_details (place_id, part, data, fetched_at) VALUES (?, ?, ?, ?)",
+                    [(place_id, part, json.dumps(data, ensure_ascii=False), now) for part, data in parts.items()])
+        finally:
+            conn.close()
+
+    # --- place_id ya resueltos (nombre -> place_id), para saltarse la búsqueda ---
+    def resolved_id(self, query, ttl):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT place_id, resolved_at FROM place_ids WHERE query = ?", (query,)).fetchone()
+        finally:
+            conn.close()
+        if row and time.time() - row[1] < ttl:
+            return row[0]
+        return None
+
+    def remember_id(self, query, place_id):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO place_ids (query, place_id, resolved_at) VALUES (?, ?, ?)",
+                             (query, place_id, time.time()))
+        finally:
+            conn.close()
+
+    def stats(self):
+        conn = self._connect()
+        try:
+            size = conn.execute("SELECT COUNT(DISTINCT place_id) FROM place_details").fetchone()[0]
+        finally:
+            conn.close()
+        return dict(self.counters, size=size)
+
+
+# -----------------------------
+# CACHÉ DE FOTOS EN DISCO
+# -----------------------------
+# Cada variante (referencia de Google + ancho) es un archivo cuyo nombre es el
+# hash de esa llave, con el tipo de contenido al lado. La primera descarga se
+# manda al cliente mientras se escribe en disco; las siguientes se sirven del
+# archivo (send_file usa sendfile cuando el servidor lo permite). Si otra
+# petición ya está descargando la misma foto, se espera a que termine.
+
+
+class PhotoCache:
+    """Fotos en disco direccionadas por (referencia, ancho), con tope de tamaño."""
+
+    def __init__(self, directory, max_bytes=0, wait_seconds=15):
+        self.directory = os.path.abspath(directory)  # send_file resuelve rutas relativas desde la app
+        self.max_bytes = max_bytes  # 0 = sin tope
+        self.wait_seconds = wait_seconds
+        self._after_fork()
+        self.counters = {"hits": 0, "misses": 0, "waits": 0, "stored": 0, "aborted": 0, "evictions": 0}
+        os.register_at_fork(after_in_child=self._after_fork)
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for _, _, size in self._files())
+
+    def _after_fork(self):
+        # Las descargas en curso del padre no siguen en el hijo
+        self._lock = threading.Lock()
+        self._downloads = {}  # llave -> Event de la descarga en curso
+
+    @staticmethod
+    def key(ref, width):
+        return hashlib.sha1(f"{ref}:{width}".encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key[:2], key)
+        return base, base + ".type"
+
+    def _files(self):
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir(): continue
+            for entry in os.scandir(sub.path):
+                if "." not in entry.name:
+                    st = entry.stat()
+                    yield entry.path, st.st_mtime, st.st_size
+
+    def __contains__(self, key):
+        return os.path.exists(self._paths(key)[0])
+
+    def lookup(self, key):
+        """(ruta, tipo de contenido) si la variante ya está en disco; None si no."""
+        path, meta = self._paths(key)
+        try:
+            with open(meta, "r", encoding="utf-8") as f:
+                content_type = f.read().strip()
+        except FileNotFoundError:
+            content_type = None
+        if content_type and os.path.exists(path):
+            self.counters["hits"] += 1
+            return path, content_type
+        return None
+
+    def claim(self, key):
+        """True si esta petición debe descargar la foto. Si otra ya la descarga, espera y devuelve False."""
+        with self._lock:
+            event = self._downloads.get(key)
+            if event is None:
+                self._downloads[key] = threading.Event()
+                self.counters["misses"] += 1
+                return True
+            self.counters["waits"] += 1
+        event.wait(self.wait_seconds)
+        return False
+
+    def release(self, key):
+        with self._lock:
+            event = self._downloads.pop(key, None)
+        if event: event.set()
+
+    def tee(self, key, chunks, content_type):
+        """Entrega los pedazos al cliente y los escribe en disco; completa, la foto queda en caché."""
+        path, meta = self._paths(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        size, done = 0, False
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            with open(meta, "w", encoding="utf-8") as f:
+                f.write(content_type)
+            os.replace(tmp, path)  # atómico: nadie ve una foto a medias
+            done = True
+            with self._lock:
+                self.size += size
+                self.counters["stored"] += 1
+            if self.max_bytes and self.size > self.max_bytes:
+                self._prune()
+        finally:
+            if not done:
+                # Cliente desconectado o Google cortó la descarga: no se guarda nada
+                self.counters["aborted"] += 1
+                try:
+                    os.remove(tmp)
+                except FileNotFoundError:
+                    pass
+            self.release(key)
+
+    def _prune(self):
+        # Se borran las fotos más antiguas hasta quedar en el 90 % del tope
+        with self._lock:
+            files = sorted(self._files(), key=lambda f: f[1])
+            for path, _, size in files:
+                if self.size <= self.max_bytes * 0.9: break
+                for victim in (path, path + ".type"):
+                    try:
+                        os.remove(victim)
+                    except FileNotFoundError:
+                        pass
+                self.size -= size
+                self.counters["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, size_bytes=self.size, downloading=len(self._downloads))
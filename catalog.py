@@ -0,0 +1,393 @@
+import bisect
+import hashlib
+import re
+import unicodedata
+import urllib.parse
+from collections import namedtuple
+from spatial import SpatialIndex, coords_of
+
+# -----------------------------
+# CATÁLOGO INDEXADO DE LUGARES
+# -----------------------------
+# Se construye una sola vez a partir de CAMPECHE_DATA. Cada lugar queda
+# representado por un registro compacto que apunta al dict original, así
+# las reseñas siguen guardándose dentro del documento que se sube a la nube.
+# Lo derivado (liga de Maps, texto de búsqueda, coordenadas) se calcula al
+# cargar; las peticiones no escriben en los lugares. Las reseñas se separan
+# del dict del lugar (Place.reviews) y solo vuelven a unirse al guardar.
+
+GRUPOS = ("restaurantes_famosos", "lugares_comunidad", "municipios_data", "puntos_interes_recomendados")
+
+# Campos que versiones anteriores escribían en cada petición y terminaban subiéndose a la nube
+TRANSIENT_KEYS = ("maps_url", "_dist", "_d")
+TRANSIENT_ORIGEN = "Datos Naaj 🟠"
+
+# Resultado de una consulta por distancia: el valor propio de la petición va aquí, no en el lugar
+Hit = namedtuple("Hit", ["dist", "place"])
+
+
+def normalize_name(name):
+    """Normaliza un nombre para usarlo como llave de búsqueda."""
+    return " ".join(str(name or "").lower().split())
+
+
+def fold_text(text):
+    """Minúsculas y sin acentos: 'Champotón' -> 'champoton'."""
+    text = unicodedata.normalize("NFKD", str(text or "").lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def rating_value(place):
+    """Rating como número para ordenar ("N/A" o vacío cuentan como 0)."""
+    try:
+        return float(place.get("rating") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def stem(token):
+    """Stemming ligero para plurales: 'mariscos' -> 'marisco', 'hoteles' -> 'hotel'."""
+    if len(token) > 3 and token.endswith("s"):
+        token = token[:-1]
+    if len(token) > 4 and token.endswith("e"):
+        token = token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Convierte un texto en el conjunto de tokens que usa el índice invertido."""
+    return {stem(t) for t in re.findall(r"\w+", fold_text(text)) if len(t) > 1}
+
+
+def generate_maps_link(lat, lng, name, address):
+    if lat and lng: return f"https://www.google.com/maps/search/?api=1&query={lat},{lng}"
+    query = urllib.parse.quote(f"{name} {address}")
+    return f"https://www.google.com/maps/search/?api=1&query={query}"
+
+
+def strip_transient(item):
+    """Quita del lugar los campos temporales que se colaron al documento."""
+    for key in TRANSIENT_KEYS:
+        item.pop(key, None)
+    if item.get("origen") == TRANSIENT_ORIGEN:
+        del item["origen"]
+
+
+def make_place_id(grupo, municipio, key, taken=()):
+    """Id de un lugar: depende solo del contenido, así se mantiene entre recargas.
+
+    `taken` son los ids ya usados; con nombres repetidos se agrega -2, -3...
+    """
+    base = hashlib.sha1(f"{grupo}|{municipio or ''}|{key}".encode("utf-8")).hexdigest()[:12]
+    place_id, n = base, 1
+    while place_id in taken:
+        n += 1
+        place_id = f"{base}-{n}"
+    return place_id
+
+
+def iter_raw_places(data):
+    """Recorre todos los lugares del documento en el orden histórico de búsqueda."""
+    for item in data.get("restaurantes_famosos", []):
+        yield "restaurantes_famosos", None, None, item
+    for item in data.get("lugares_comunidad", []):
+        yield "lugares_comunidad", None, None, item
+    for mun_key, m_data in data.get("municipios_data", {}).items():
+        for item in m_data.get("lugares", []):
+            yield "municipios_data", mun_key, None, item
+    for cat_key, items in data.get("puntos_interes_recomendados", {}).items():
+        for item in items:
+            yield "puntos_interes_recomendados", None, cat_key, item
+
+
+def map_raw_places(data, fn):
+    """Copia superficial del documento con cada lugar reemplazado por fn(grupo, lugar)."""
+    doc = dict(data)
+    if "restaurantes_famosos" in data:
+        doc["restaurantes_famosos"] = [fn("restaurantes_famosos", i) for i in data["restaurantes_famosos"]]
+    if "lugares_comunidad" in data:
+        doc["lugares_comunidad"] = [fn("lugares_comunidad", i) for i in data["lugares_comunidad"]]
+    if "municipios_data" in data:
+        doc["municipios_data"] = {
+            k: dict(m, lugares=[fn("municipios_data", i) for i in m["lugares"]]) if "lugares" in m else m
+            for k, m in data["municipios_data"].items()
+        }
+    if "puntos_interes_recomendados" in data:
+        doc["puntos_interes_recomendados"] = {
+            k: [fn("puntos_interes_recomendados", i) for i in items]
+            for k, items in data["puntos_interes_recomendados"].items()
+        }
+    return doc
+
+
+class RatingStats:
+    """Agregados de las reseñas de un lugar: conteo, suma e histograma de 1 a 5 estrellas."""
+
+    __slots__ = ("count", "total", "histogram", "ids")
+
+    def __init__(self, reviews=()):
+        self.count = 0
+        self.total = 0.0
+        self.histogram = [0] * 5
+        self.ids = set()
+        for review in reviews:
+            self.add(review)
+
+    def add(self, review):
+        """Suma una reseña en O(1). Devuelve False si ya estaba contada (mismo id)."""
+        review_id = review.get("id")
+        if review_id:
+            if review_id in self.ids: return False
+            self.ids.add(review_id)
+        rating = float(review.get("rating") or 0)
+        self.count += 1
+        self.total += rating
+        self.histogram[min(5, max(1, int(rating + 0.5))) - 1] += 1
+        return True
+
+    @property
+    def average(self):
+        return round(self.total / self.count, 1) if self.count else None
+
+    def as_dict(self):
+        return {"count": self.count, "average": self.average,
+                "histogram": {str(i + 1): n for i, n in enumerate(self.histogram)}}
+
+
+def sort_reviews(reviews):
+    """Deja las reseñas de la más vieja a la más nueva (solo ordena si hace falta)."""
+    dates = [r.get("date", "") for r in reviews]
+    if any(a > b for a, b in zip(dates, dates[1:])):
+        reviews.sort(key=lambda r: r.get("date", ""))
+
+
+class Place:
+    """Registro compacto de un lugar del catálogo (de solo lectura después de crearse)."""
+
+    __slots__ = ("id", "seq", "nombre", "key", "grupo", "municipio", "categoria",
+                 "text", "lat", "lng", "maps_url", "reviews", "stats", "data")
+
+    def __init__(self, place_id, seq, grupo, municipio, categoria, data):
+        self.id = place_id
+        self.seq = seq
+        self.nombre = data.get("nombre", "")
+        self.key = normalize_name(self.nombre)
+        self.grupo = grupo
+        self.municipio = municipio
+        self.categoria = categoria
+        # Texto de búsqueda (sin acentos) y coordenadas planas, calculados una vez
+        self.text = fold_text(f"{self.nombre} {data.get('categoria', '')} {data.get('direccion', '')}")
+        self.lat, self.lng = coords_of(data) or (None, None)
+        self.maps_url = generate_maps_link(self.lat, self.lng, self.nombre, "" if self.lat else data.get("direccion", ""))
+        # Reseñas aparte del dict (las lecturas del catálogo no las cargan), de la más
+        # vieja a la más nueva (las nuevas entran al final) y con sus agregados. El
+        # documento las guarda al revés: de la más nueva a la más vieja
+        self.reviews = (data.pop("reviews", None) or [])[::-1]
+        sort_reviews(self.reviews)
+        self.stats = RatingStats(self.reviews)
+        self.data = data
+
+    def __repr__(self):
+        return f"Place({self.id!r}, {self.nombre!r})"
+
+    def as_result(self, **extra):
+        """Copia del lugar para una respuesta, con la liga de Maps y los campos de la petición."""
+        result = dict(self.data, maps_url=self.maps_url)
+        result.update(extra)
+        return result
+
+    def add_review(self, review):
+        """Agrega una reseña al final y actualiza los agregados sin recorrer las demás.
+
+        Devuelve False si la reseña ya estaba (la bitácora puede repetir reseñas que ya
+        llegaron a la nube).
+        """
+        if not self.stats.add(review): return False
+        self.reviews.append(review)
+        self.data["rating"] = self.stats.average
+        return True
+
+    def reviews_page(self, cursor=None, limit=10):
+        """Una página de reseñas (de la más nueva a la más vieja): (reseñas, siguiente_cursor).
+
+        El cursor es la posición (desde la más vieja) de la primera reseña de la página,
+        así no se corre cuando llegan reseñas nuevas mientras alguien está paginando.
+        """
+        total = len(self.reviews)
+        stop = total if cursor is None else max(0, min(total, cursor + 1))
+        start = max(0, stop - limit)
+        page = self.reviews[start:stop][::-1]
+        return page, start - 1 if start > 0 else None
+
+
+class Rankings:
+    """Listas de lugares ordenadas por rating: global, por municipio, por categoría y por grupo.
+
+    Cada lista guarda tuplas (-rating, -reseñas, seq, place) en orden con bisect;
+    seq es único, así nunca se llega a comparar el Place. Cuando cambia el rating
+    de un lugar solo se saca y se vuelve a meter su entrada en las listas donde
+    aparece (búsqueda O(log n) + el corrimiento de la lista, que es un memmove).
+    Leer el top k es cortar la lista: no depende del tamaño del catálogo.
+    """
+
+    def __init__(self):
+        self.lists = {}    # (dimensión, valor) -> entradas ordenadas
+        self.entries = {}  # place.id -> (entrada actual, llaves de sus listas)
+
+    @staticmethod
+    def key(value):
+        return fold_text(normalize_name(value))
+
+    @staticmethod
+    def _entry(place):
+        return (-rating_value(place.data), -place.stats.count, place.seq, place)
+
+    def add(self, place, categorias):
+        municipio = self.key(place.municipio)
+        buckets = [("global", ""), ("grupo", place.grupo)]
+        if municipio: buckets.append(("municipio", municipio))
+        for cat in {self.key(c) for c in categorias} - {""}:
+            buckets.append(("categoria", cat))
+            if municipio: buckets.append(("municipio_categoria", f"{municipio}|{cat}"))
+        entry = self._entry(place)
+        for bucket in buckets:
+            bisect.insort(self.lists.setdefault(bucket, []), entry)
+        self.entries[place.id] = (entry, buckets)
+
+    def update(self, place):
+        """Reacomoda un lugar cuyo rating o número de reseñas cambió (si está en los rankings)."""
+        if place.id not in self.entries: return
+        old, buckets = self.entries[place.id]
+        new = self._entry(place)
+        if new[:3] == old[:3]: return
+        for bucket in buckets:
+            entries = self.lists[bucket]
+            del entries[bisect.bisect_left(entries, old)]
+            bisect.insort(entries, new)
+        self.entries[place.id] = (new, buckets)
+
+    def ranked(self, municipio=None, categoria=None, grupo=None):
+        """Las entradas ordenadas de una vista (sin copiar); lista vacía si no existe."""
+        municipio, categoria = self.key(municipio), self.key(categoria)
+        if grupo: bucket = ("grupo", grupo)
+        elif municipio and categoria: bucket = ("municipio_categoria", f"{municipio}|{categoria}")
+        elif municipio: bucket = ("municipio", municipio)
+        elif categoria: bucket = ("categoria", categoria)
+        else: bucket = ("global", "")
+        return self.lists.get(bucket, [])
+
+    def top(self, limit, **scope):
+        """Los `limit` lugares mejor calificados de la vista, como Place."""
+        return [entry[3] for entry in self.ranked(**scope)[:limit]]
+
+
+class Catalog:
+    """Índice en memoria de los lugares: por id, nombre, municipio, categoría, grupo y palabra."""
+
+    def __init__(self, data):
+        self.data = data
+        self.by_id = {}
+        self.by_name = {}
+        self.by_municipio = {}
+        self.by_categoria = {}
+        self.by_grupo = {g: [] for g in GRUPOS}
+        self.by_token = {}
+        self.spatial = SpatialIndex()
+        self.rankings = Rankings()
+        for grupo, municipio, cat_key, item in iter_raw_places(data):
+            self._index(grupo, municipio, cat_key, item)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def _make_id(self, grupo, municipio, key):
+        return make_place_id(grupo, municipio, key, self.by_id)
+
+    def _index(self, grupo, municipio, cat_key, item):
+        strip_transient(item)
+        key = normalize_name(item.get("nombre"))
+        categoria = normalize_name(item.get("categoria")) or normalize_name(cat_key)
+        place = Place(self._make_id(grupo, municipio, key), len(self.by_id), grupo, municipio, categoria, item)
+
+        self.by_id[place.id] = place
+        # Con nombres repetidos gana el primero, igual que el recorrido lineal anterior
+        self.by_name.setdefault(place.key, place)
+        if municipio:
+            self.by_municipio.setdefault(municipio, []).append(place)
+        categorias = {categoria, normalize_name(cat_key)} - {""}
+        for cat in categorias:
+            self.by_categoria.setdefault(cat, []).append(place)
+        self.by_grupo[grupo].append(place)
+        # En los rankings entra solo el lugar al que resuelve el nombre (el que recibe las
+        # reseñas); si no, un lugar repetido en dos grupos aparecería dos veces
+        if self.by_name[place.key] is place:
+            self.rankings.add(place, categorias)
+
+        # Índice invertido: mismo texto que se revisaba antes (nombre, categoría y dirección)
+        for token in tokenize(place.text):
+            self.by_token.setdefault(token, []).append(place)
+
+        if place.lat is not None:
+            self.spatial.add(place.id, place, place.lat, place.lng)
+        return place
+
+    # --- Consultas ---
+    def get(self, place_id):
+        return self.by_id.get(place_id)
+
+    def find(self, name):
+        """Busca un lugar por nombre (sin importar mayúsculas ni espacios)."""
+        return self.by_name.get(normalize_name(name))
+
+    def in_grupo(self, grupo):
+        return self.by_grupo.get(grupo, [])
+
+    def search(self, terms, where=None):
+        """Lugares que contienen alguna de las palabras, en orden de catálogo.
+
+        Las palabras se normalizan igual que el índice (sin acentos, minúsculas y
+        sin plural), así 'champoton' encuentra 'Champotón'. `where` filtra los
+        resultados con un predicado opcional sobre el Place.
+        """
+        hits = {}
+        for term in terms:
+            for token in tokenize(term):
+                for place in self.by_token.get(token, ()):
+                    if where is None or where(place):
+                        hits[place.id] = place
+        return sorted(hits.values(), key=lambda p: p.seq)
+
+    def nearest(self, lat, lng, k, where=None):
+        """Los k lugares con coordenadas más cercanos: lista de Hit(dist, place)."""
+        return [Hit(d, p) for d, p in self.spatial.nearest(float(lat), float(lng), k, where)]
+
+    def distances(self, lat, lng, places):
+        """Distancia en km a cada lugar (9999 si no tiene coordenadas)."""
+        return self.spatial.distances(float(lat), float(lng), [p.id for p in places])
+
+    def by_distance(self, lat, lng, places):
+        """Los lugares ordenados del más cercano al más lejano, como Hit(dist, place)."""
+        hits = [Hit(d, p) for d, p in zip(self.distances(lat, lng, places), places)]
+        hits.sort(key=lambda h: h.dist)
+        return hits
+
+    def to_document(self):
+        """Documento completo para guardar: cada lugar vuelve a llevar sus reseñas (la más nueva primero)."""
+        places = {id(p.data): p for p in self.by_id.values()}
+        return map_raw_places(self.data, lambda grupo, item: dict(item, reviews=places[id(item)].reviews[::-1]))
+
+    def top_rated(self, limit, municipio=None, categoria=None, grupo=None):
+        """Los mejor calificados (global, por municipio, categoría, ambos o grupo) sin recorrer el catálogo."""
+        return self.rankings.top(limit, municipio=municipio, categoria=categoria, grupo=grupo)
+
+    # --- Altas ---
+    def add_community_place(self, item):
+        """Agrega un lugar nuevo a 'lugares_comunidad' y lo indexa."""
+        self.data.setdefault("lugares_comunidad", []).append(item)
+        return self._index("lugares_comunidad", None, None, item)
+
+    def add_review(self, place, review):
+        """Agrega la reseña al lugar y lo reacomoda en los rankings. False si ya estaba."""
+        if not place.add_review(review): return False
+        self.rankings.update(place)
+        return True
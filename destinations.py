@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import heapq
+from itertools import chain, islice
+from catalog import rating_value
+from spatial import haversine_many
+
+# -----------------------------
+# /DESTINATIONS PRECALCULADO
+# -----------------------------
+# Las listas de /destinations se arman en segundo plano: un "pool" de lugares
+# de Google por categoría (se renueva cada tanto y se guarda en disco para
+# todos los workers) y, por categoría, la lista combinada con el catálogo sin
+# repetidos y su "popular". La petición solo elige una categoría, toma los
+# k más cercanos (índice espacial + los pocos del pool) y arma la respuesta:
+# nada de red ni de ordenar todo el catálogo en cada llamada.
+
+DESTINATION_GRUPOS = ("restaurantes_famosos", "municipios_data", "lugares_comunidad")
+TOP_K = 8
+NEAR_K = 16
+
+
+class DestinationPools:
+    """Resultados de Google por categoría en un JSON compartido por los workers."""
+
+    def __init__(self, path):
+        self.path = path
+        self.pools = {}
+        self.fetched_at = 0.0
+        self._mtime = None
+
+    def reload(self):
+        """Relee el archivo si otro proceso lo cambió. Devuelve True si hubo cambios."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime: return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+        except ValueError:
+            return False
+        self.pools, self.fetched_at, self._mtime = doc.get("pools", {}), doc.get("fetched_at", 0.0), mtime
+        return True
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def save(self, pools):
+        self.pools, self.fetched_at = pools, time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": self.fetched_at, "pools": pools}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+
+class CategoryView:
+    """Lo precalculado de una categoría: combinada sin repetidos, popular y el pool con coordenadas."""
+
+    __slots__ = ("merged", "popular", "google_names", "google_lats", "google_lngs", "google_located")
+
+    def __init__(self, local, google, local_ranked=None):
+        # Mismo criterio que antes: si un nombre está en los dos, gana el de Google
+        self.merged = list({p["nombre"]: p for p in chain(local, google)}.values())
+        self.google_names = {g["nombre"] for g in google}
+        if local_ranked is None:
+            self.popular = heapq.nlargest(TOP_K, self.merged, key=rating_value)
+        else:
+            # Del catálogo basta con los primeros de sus rankings; solo el pool se ordena aquí
+            candidates = heapq.nlargest(TOP_K, chain(local_ranked(self.google_names), google), key=rating_value)
+            merged = {p["nombre"]: p for p in candidates}
+            self.popular = [p for p in candidates if merged[p["nombre"]] is p][:TOP_K]
+        located = [g for g in google if (g.get("coordenadas") or {}).get("lat") is not None]
+        self.google_located = located
+        self.google_lats = [g["coordenadas"]["lat"] for g in located]
+        self.google_lngs = [g["coordenadas"]["lng"] for g in located]
+
+
+class DestinationsSnapshot:
+    """Vista inmutable de /destinations para un catálogo y unos pools dados."""
+
+    def __init__(self, catalog, pools, grupos=DESTINATION_GRUPOS):
+        self.catalog = catalog
+        self.grupos = grupos
+        local = [p.data for p in chain(*(catalog.in_grupo(g) for g in grupos))]
+        self.views = [CategoryView(local, results, self.local_ranked) for results in pools.values()] \
+            or [CategoryView(local, [], self.local_ranked)]
+        self.built_at = time.time()
+
+    def local_ranked(self, exclude):
+        """Los TOP_K mejor calificados del catálogo en los grupos de /destinations, sin los nombres de `exclude`."""
+        lists = [self.catalog.rankings.ranked(grupo=g) for g in self.grupos]
+        places = (entry[3] for entry in heapq.merge(*lists))
+        return [p.data for p in islice((p for p in places if p.nombre not in exclude), TOP_K)]
+
+    def pick(self, rng):
+        return rng.choice(self.views)
+
+    def suggested(self, view, lat, lng):
+        """Los TOP_K más cercanos (catálogo + pool de Google), completando con lugares sin coordenadas."""
+        grupos, names = self.grupos, view.google_names
+        local_near = self.catalog.nearest(lat, lng, NEAR_K, where=lambda p: p.grupo in grupos and p.nombre not in names)
+        google_near = zip(haversine_many(lat, lng, view.google_lats, view.google_lngs), view.google_located) \
+            if view.google_located else ()
+        ranked = heapq.nsmallest(NEAR_K, chain(((d, p.data) for d, p in local_near), google_near),
+                                 key=lambda x: x[0])
+
+        suggested, seen = [], set()
+        for _, p in ranked:
+            if p["nombre"] not in seen:
+                seen.add(p["nombre"])
+                suggested.append(p)
+        for p in view.merged:
+            if len(suggested) >= TOP_K: break
+            if p["nombre"] not in seen:
+                seen.add(p["nombre"])
+                suggested.append(p)
+        return suggested[:TOP_K]
@@ -0,0 +1,238 @@
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from catalog import Catalog
+
+# -----------------------------
+# SERVIDORES FALSOS (GOOGLE PLACES, GEMINI, JSONBIN)
+# -----------------------------
+# Imitan lo que la app usa de cada API, con datos sacados de campeche.json,
+# para correr la app, pruebas de carga y benchmarks sin red ni claves.
+# Latencia y errores se inyectan por servicio.
+#
+# Uso: python fakes.py [--port 8780] [--latency-ms 80] [--jitter-ms 40] [--error-rate 0.05]
+# y luego, en otra terminal, exportar las variables que imprime y arrancar app.py.
+
+SERVICES = ("google", "gemini", "jsonbin")
+
+
+class FakeServer(ThreadingHTTPServer):
+    """Servidor HTTP con latencia (base + jitter) y una fracción de respuestas 503."""
+
+    daemon_threads = True
+
+    def __init__(self, address, handler, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        super().__init__(address, handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.counters = {"requests": 0, "errors": 0}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """Base: inyecta latencia/errores y despacha a do_<MÉTODO> de cada servicio."""
+
+    def log_message(self, format, *args):
+        pass  # sin una línea por petición (estorba en las pruebas de carga)
+
+    def _inject(self):
+        server = self.server
+        with server.rng_lock:
+            server.counters["requests"] += 1
+            delay = server.latency + server.rng.uniform(0, server.jitter)
+            fail = server.rng.random() < server.error_rate
+        if delay: time.sleep(delay)
+        if fail:
+            server.counters["errors"] += 1
+            self.send_json({"error": "fake failure"}, status=503)
+        return fail
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_body(body, "application/json; charset=utf-8", status)
+
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD": self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    @property
+    def route(self):
+        parts = urlsplit(self.path)
+        return parts.path, {k: v[0] for k, v in parse_qs(parts.query).items()}
+
+    def do_HEAD(self):
+        self.send_body(b"", "text/plain")  # precalentado de conexiones
+
+
+# --- Google Places ---
+class GooglePlacesHandler(FakeHandler):
+    """/maps/api/place/{textsearch,nearbysearch,details}/json y /photo."""
+
+    catalog = None
+
+    def _place_json(self, place):
+        data = place.data
+        return {
+            "place_id": f"fake-{place.id}",
+            "name": place.nombre,
+            "vicinity": data.get("direccion"),
+            "formatted_address": data.get("direccion"),
+            "rating": data.get("rating") if isinstance(data.get("rating"), (int, float)) else 4.0,
+            "geometry": {"location": {"lat": place.lat, "lng": place.lng}},
+            "photos": [{"photo_reference": f"fakeref-{place.id}"}],
+            "opening_hours": {"open_now": True, "weekday_text": ["lunes: 9:00–18:00"]},
+            "types": [place.categoria or "point_of_interest"],
+        }
+
+    def do_GET(self):
+        if self._inject(): return
+        path, q = self.route
+        located = [p for p in self.catalog.by_id.values() if p.lat is not None]
+        if path.endswith("/textsearch/json") or path.endswith("/nearbysearch/json"):
+            # search() tokeniza y normaliza igual que el índice real
+            ids = {p.id for p in self.catalog.search([q.get("query") or q.get("keyword") or ""])}
+            places = [p for p in located if p.id in ids]
+            if "location" in q:
+                lat, lng = map(float, q["location"].split(","))
+                places = [h.place for h in self.catalog.by_distance(lat, lng, places)]
+            results = [self._place_json(p) for p in places[:20]]
+            return self.send_json({"status": "OK" if results else "ZERO_RESULTS", "results": results})
+        if path.endswith("/details/json"):
+            place = self.catalog.get(q.get("place_id", "").replace("fake-", "", 1))
+            if not place or place.lat is None:
+                return self.send_json({"status": "NOT_FOUND"})
+            return self.send_json({"status": "OK", "result": self._place_json(place)})
+        if path.endswith("/photo"):
+            width = int(q.get("maxwidth", 400))
+            ref = q.get("photo_reference", "")
+            svg = (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{width * 2 // 3}">'
+                   f'<rect width="100%" height="100%" fill="#2e7d6b"/>'
+                   f'<text x="8" y="24" fill="#fff" font-size="16">{ref}</text></svg>')
+            return self.send_body(svg.encode("utf-8"), "image/svg+xml")
+        self.send_json({"status": "INVALID_REQUEST"}, status=404)
+
+
+# --- Gemini ---
+class GeminiHandler(FakeHandler):
+    """POST /v1beta/models/<modelo>:generateContent: respuesta fija armada con los datos del prompt."""
+
+    def do_POST(self):
+        if self._inject(): return
+        path, _ = self.route
+        if not path.endswith(":generateContent"):
+            return self.send_json({"error": {"code": 404, "message": "not found"}}, status=404)
+        prompt = "".join(p.get("text", "") for c in self.read_json().get("contents", []) for p in c.get("parts", []))
+        names = re.findall(r'"nombre": "([^"]+)"', prompt)[:3]
+        if names:
+            text = f"Ma'alob k'iin 🦎 Te recomiendo: {', '.join(names)}. ||| NO_IMAGE ||| {names[0]}"
+        else:
+            text = "Ma'alob k'iin 🦎 (respuesta de prueba)"
+        self.send_json({"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]})
+
+
+# --- JSONBin ---
+class JsonBinHandler(FakeHandler):
+    """GET/PUT /b/<bin> y GET /b/<bin>/versions/count, en memoria."""
+
+    record = None
+    versions = 1
+    lock = threading.Lock()
+
+    def do_GET(self):
+        if self._inject(): return
+        path, _ = self.route
+        cls = type(self)
+        with cls.lock:
+            if path.endswith("/versions/count"):
+                return self.send_json({"metadata": {"versionCount": cls.versions}})
+            if re.fullmatch(r"(/v3)?/b/[^/]+(/latest)?", path):
+                return self.send_json({"record": cls.record, "metadata": {"version": cls.versions}})
+        self.send_json({"message": "not found"}, status=404)
+
+    def do_PUT(self):
+        if self._inject(): return
+        path, _ = self.route
+        if not re.fullmatch(r"(/v3)?/b/[^/]+", path):
+            return self.send_json({"message": "not found"}, status=404)
+        record = self.read_json()
+        cls = type(self)
+        with cls.lock:
+            cls.record = record
+            cls.versions += 1
+            self.send_json({"record": {}, "metadata": {"version": cls.versions}})
+
+
+def start_fakes(data, host="127.0.0.1", port=0, services=SERVICES, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+    """Arranca los servidores falsos en hilos de fondo: {servicio: FakeServer}.
+
+    Con port=0 cada uno toma un puerto libre; si no, usan port, port+1, port+2.
+    """
+    GooglePlacesHandler.catalog = Catalog(json.loads(json.dumps(data)))
+    JsonBinHandler.record = data
+    handlers = {"google": GooglePlacesHandler, "gemini": GeminiHandler, "jsonbin": JsonBinHandler}
+    servers = {}
+    for i, name in enumerate(services):
+        server = FakeServer((host, port + i if port else 0), handlers[name], latency, jitter, error_rate,
+                            None if seed is None else seed + i)
+        threading.Thread(target=server.serve_forever, name=f"fake-{name}", daemon=True).start()
+        servers[name] = server
+    return servers
+
+
+def fake_env(servers):
+    """Variables de entorno para que la app use los servidores falsos."""
+    env = {}
+    if "google" in servers:
+        env.update(GOOGLE_PLACES_BASE_URL=servers["google"].url + "/maps/api/place", GOOGLE_API_KEY="fake")
+    if "gemini" in servers:
+        env.update(GEMINI_BASE_URL=servers["gemini"].url, GEMINI_API_KEY="fake")
+    if "jsonbin" in servers:
+        env.update(JSONBIN_BASE_URL=servers["jsonbin"].url + "/v3", JSONBIN_API_KEY="fake",
+                   JSONBIN_BIN_ID="fake", NAAJ_STORAGE="jsonbin")
+    return env
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidores falsos de Google Places, Gemini y JSONBin")
+    parser.add_argument("--data", default="campeche.json")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8780, help="primer puerto (uno por servicio)")
+    parser.add_argument("--services", default=",".join(SERVICES))
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0, help="fracción de respuestas 503 (0-1)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    with open(args.data, "r", encoding="utf-8") as f:
+        document = json.load(f)
+    services = [s for s in args.services.split(",") if s in SERVICES]
+    servers = start_fakes(document, args.host, args.port, services, args.latency_ms / 1000,
+                          args.jitter_ms / 1000, args.error_rate, args.seed)
+    print("🧪 Servidores falsos listos. Para usarlos:")
+    for key, value in fake_env(servers).items():
+        print(f"export {key}={value}")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        sys.exit(0)
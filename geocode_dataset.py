@@ -1,11 +1,12 @@
 import os
 import json
-import requests
+import http_client
 from dotenv import load_dotenv
 
 # Carga tus claves del archivo .env
 load_dotenv()
 GOOGLE_KEY = os.getenv("GOOGLE_API_KEY")
+BASE_URL = os.getenv("GOOGLE_PLACES_BASE_URL", "https://maps.googleapis.com/maps/api/place")
 
 # AJUSTE: Rutas directas a tu archivo en la raíz
 INPUT_PATH = "campeche.json"
@@ -21,12 +22,12 @@ def geocode_place(place_name, municipio="Campeche"):
     print(f"📡 Consultando a Google: {query}...")
 
     url = (
-        "https://maps.googleapis.com/maps/api/place/textsearch/json?"
+        f"{BASE_URL}/textsearch/json?"
         f"query={query}&key={GOOGLE_KEY}"
     )
 
     try:
-        response = requests.get(url).json()
+        response = http_client.get(url).json()
         if response.get("results"):
             location = response["results"][0]["geometry"]["location"]
             return {"lat": location["lat"], "lng": location["lng"]}
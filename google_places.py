@@ -1,11 +1,11 @@
 import os
-import requests
+import http_client
 from dotenv import load_dotenv
 
 load_dotenv()
 GOOGLE_KEY = os.getenv("GOOGLE_API_KEY")
 
-BASE_URL = "https://maps.googleapis.com/maps/api/place"
+BASE_URL = os.getenv("GOOGLE_PLACES_BASE_URL", "https://maps.googleapis.com/maps/api/place")
 
 
 def search_places(query, lat=None, lng=None, radius=5000):
@@ -22,7 +22,7 @@ def search_places(query, lat=None, lng=None, radius=5000):
             f"?query={query}+Campeche+México&key={GOOGLE_KEY}"
         )
 
-    data = requests.get(url).json()
+    data = http_client.get(url).json()
     results = data.get("results", [])
 
     cleaned = []
@@ -45,5 +45,5 @@ def get_place_details(place_id):
         f"place_id={place_id}&key={GOOGLE_KEY}"
     )
 
-    data = requests.get(url).json()
+    data = http_client.get(url).json()
     return data.get("result")
@@ -0,0 +1,25 @@
+import os
+
+# -----------------------------
+# CONFIGURACIÓN DE GUNICORN
+# -----------------------------
+# preload_app: la app (y los datos) se cargan UNA vez en el proceso maestro y
+# los workers la heredan con copy-on-write, en lugar de que cada worker
+# descargue JSONBin y guarde su propia copia. Las reseñas nuevas se comparten
+# entre workers por la bitácora en NAAJ_STATE_DIR (ver persistence.py).
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+preload_app = True
+timeout = 120
+
+
+# Los hilos de fondo arrancan en cada worker (post_fork), nunca en el maestro:
+# un hilo del maestro con un candado tomado lo dejaría tomado en el worker
+os.environ["NAAJ_BACKGROUND_IN_WORKERS"] = "1"
+
+
+def post_fork(server, worker):
+    # Recarga del documento, fotos, /destinations y conexiones HTTP propias de cada worker
+    from app import start_background_threads
+    start_background_threads()
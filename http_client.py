@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import base64
+import random
+import hashlib
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# -----------------------------
+# CLIENTE HTTP COMPARTIDO
+# -----------------------------
+# Una sesión con keep-alive por host (Google, JSONBin...), así cada llamada
+# reutiliza la conexión TCP/TLS abierta en lugar de negociarla de nuevo.
+# Todas las llamadas llevan timeout y los errores pasajeros se reintentan
+# con espera exponencial aleatoria (jitter).
+
+DEFAULT_TIMEOUT = (3.05, 15)  # (conexión, lectura) en segundos
+RETRY_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+
+# -----------------------------
+# GRABAR Y REPRODUCIR (FIXTURES)
+# -----------------------------
+# HTTP_FIXTURES_MODE=record guarda cada respuesta en HTTP_FIXTURES_DIR;
+# HTTP_FIXTURES_MODE=replay las sirve desde ahí sin tocar la red (pruebas de
+# carga y benchmarks deterministas). Un archivo por método + URL; las claves
+# (parámetro `key`) no se guardan y las cabeceras no cuentan para la llave.
+SECRET_PARAMS = {"key"}
+KEPT_HEADERS = ("Content-Type", "ETag", "Cache-Control", "Retry-After")
+
+
+class Fixtures:
+    """Respuestas HTTP grabadas en disco, por método + URL (+ cuerpo de la petición)."""
+
+    def __init__(self, mode, directory):
+        self.mode = mode  # "record" | "replay"
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.counters = {"recorded": 0, "replayed": 0, "missing": 0}
+        os.makedirs(directory, exist_ok=True)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prepare(method, url, kwargs):
+        prepared = requests.Request(method, url, params=kwargs.get("params"), data=kwargs.get("data"),
+                                    json=kwargs.get("json")).prepare()
+        parts = urlsplit(prepared.url)
+        query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                           if k not in SECRET_PARAMS])
+        body = prepared.body or b""
+        if isinstance(body, str): body = body.encode("utf-8")
+        return urlunsplit(parts._replace(query=query)), hashlib.sha1(body).hexdigest()
+
+    def _path(self, method, url):
+        digest = hashlib.sha1(f"{method} {url}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{method.lower()}_{urlsplit(url).hostname}_{digest}.json")
+
+    def _read(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def record(self, method, url, kwargs, response):
+        clean_url, body_sha = self._prepare(method, url, kwargs)
+        path = self._path(method, clean_url)
+        entry = {"body_sha1": body_sha, "status": response.status_code,
+                 "headers": {h: response.headers[h] for h in KEPT_HEADERS if h in response.headers},
+                 "content_b64": base64.b64encode(response.content).decode("ascii")}
+        with self._lock:
+            fixture = self._read(path) or {"method": method, "url": clean_url, "variants": []}
+            fixture["variants"] = [v for v in fixture["variants"] if v["body_sha1"] != body_sha] + [entry]
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(fixture, f, ensure_ascii=False, indent=1)
+            os.replace(path + ".tmp", path)
+            self.counters["recorded"] += 1
+
+    def replay(self, method, url, kwargs):
+        """La respuesta grabada; si falta, ConnectionError (como si no hubiera red)."""
+        clean_url, body_sha = self._prepare(method, url, kwargs)
+        fixture = self._read(self._path(method, clean_url))
+        if not fixture:
+            self.counters["missing"] += 1
+            raise requests.ConnectionError(f"Sin fixture para {method} {clean_url}")
+        # Mismo cuerpo si lo hay; si no, la última grabación (p. ej. un PUT con otro documento)
+        entry = next((v for v in fixture["variants"] if v["body_sha1"] == body_sha), fixture["variants"][-1])
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = base64.b64decode(entry["content_b64"])
+        response._content_consumed = True  # iter_content (stream=True) lee de _content
+        response.url = clean_url
+        response.encoding = "utf-8"
+        self.counters["replayed"] += 1
+        return response
+
+
+def fixtures_from_env():
+    mode = os.getenv("HTTP_FIXTURES_MODE", "").lower()
+    if mode not in ("record", "replay"): return None
+    return Fixtures(mode, os.getenv("HTTP_FIXTURES_DIR", os.path.join("fixtures", "http")))
+
+
+class HttpClient:
+    """Pools de conexiones por host con timeouts por defecto y reintentos acotados."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=2, backoff=0.3, max_backoff=4.0, pool_size=10,
+                 fixtures=None):
+        self.fixtures = fixtures
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._sessions = {}
+        # Las conexiones abiertas antes de un fork (gunicorn --preload) no se comparten
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def session(self, url):
+        """La sesión (y su pool de conexiones) del host de `url`."""
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount(host, adapter)
+                self._sessions[host] = session
+            return session
+
+    def _sleep(self, attempt, response=None):
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        # Si el servidor dice cuánto esperar (429/503), se respeta dentro del tope
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = min(self.max_backoff, max(delay, float(retry_after)))
+        time.sleep(delay)
+
+    def request(self, method, url, timeout=None, retries=None, **kwargs):
+        """Como requests.request, pero con pool por host, timeout y reintentos (solo idempotentes)."""
+        method = method.upper()
+        if self.fixtures and self.fixtures.mode == "replay":
+            return self.fixtures.replay(method, url, kwargs)
+        retries = self.retries if retries is None else retries
+        if method not in IDEMPOTENT: retries = 0
+        session = self.session(url)
+        for attempt in range(retries + 1):
+            try:
+                response = session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= retries: raise
+                self._sleep(attempt)
+                continue
+            if response.status_code in RETRY_STATUS and attempt < retries:
+                response.close()
+                self._sleep(attempt, response)
+                continue
+            if self.fixtures: self.fixtures.record(method, url, kwargs, response)
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def prewarm(self, urls, timeout=(3.05, 5)):
+        """Abre en segundo plano una conexión con cada host para que la primera petición no negocie TLS."""
+        if self.fixtures and self.fixtures.mode == "replay": return None
+        def warm():
+            for url in urls:
+                try:
+                    self.session(url).head(url, timeout=timeout).close()
+                except requests.RequestException as e:
+                    print(f"⚠️ No se pudo precalentar {url}: {e}")
+        thread = threading.Thread(target=warm, name="http-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+
+# Cliente de todo el proceso
+CLIENT = HttpClient(fixtures=fixtures_from_env())
+get = CLIENT.get
+put = CLIENT.put
+post = CLIENT.post
+prewarm = CLIENT.prewarm
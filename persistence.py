@@ -0,0 +1,472 @@
+import os
+import json
+import uuid
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows (desarrollo local): un solo proceso, sin candados entre procesos
+    fcntl = None
+
+# -----------------------------
+# BITÁCORA DE RESEÑAS (SOLO AGREGAR) + SNAPSHOTS
+# -----------------------------
+# Cada reseña se escribe como UNA línea en reviews.jsonl (con fsync), así el
+# costo de escribir no depende del tamaño del documento. Al iniciar se carga
+# el último snapshot y se reaplica solo la cola de la bitácora. La compactación
+# guarda un snapshot nuevo y recorta la bitácora.
+#
+# La bitácora también mantiene coherentes a los workers de gunicorn: cada uno
+# recuerda hasta qué byte leyó, y con un os.stat barato sabe si otro worker
+# agregó algo. Solo lee (y aplica) lo nuevo. Las escrituras se serializan con
+# flock, así la secuencia es global.
+#
+# La compactación reemplaza el archivo y le pone una primera línea con una
+# "época" nueva. Así se sabe que el archivo es otro aunque el sistema de
+# archivos haya reusado el mismo inode (ext4 lo hace) y tenga más bytes de
+# los que ya se leyeron.
+#
+# Cuando cambia el documento base (por ejemplo, al refrescar desde la nube) se
+# escribe un snapshot nuevo y se incrementa el contador del archivo
+# `generation`; los demás workers lo leen y se recargan desde ese snapshot.
+
+
+def _write_atomic(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _parse_lines(chunk):
+    entries = []
+    for line in chunk.splitlines():
+        if not line.strip(): continue
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue  # línea dañada por un cierre abrupto
+    return entries
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """Candado exclusivo entre procesos. Entrega False si estaba ocupado y blocking=False."""
+    if fcntl is None:
+        yield True
+        return
+    with open(path, "a") as f:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(f, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _stat(path):
+    """(tamaño, mtime, inodo) del archivo, o None si no existe.
+
+    El inodo cuenta porque los reemplazos atómicos crean un archivo nuevo y el mtime
+    puede repetirse entre dos escrituras muy seguidas.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+class ReviewLog:
+    """Bitácora JSONL de solo-agregado, compartida entre procesos, con snapshots compactados."""
+
+    def __init__(self, state_dir, compact_every=500):
+        os.makedirs(state_dir, exist_ok=True)
+        self.log_path = os.path.join(state_dir, "reviews.jsonl")
+        self.lock_path = os.path.join(state_dir, "reviews.lock")
+        self.boot_lock_path = os.path.join(state_dir, "boot.lock")
+        self.upload_lock_path = os.path.join(state_dir, "upload.lock")
+        self.snapshot_path = os.path.join(state_dir, "snapshot.json")
+        self.snapshot_seq_path = os.path.join(state_dir, "snapshot_seq")
+        self.uploaded_path = os.path.join(state_dir, "uploaded_seq")
+        self.generation_path = os.path.join(state_dir, "generation")
+        self.refresh_lock_path = os.path.join(state_dir, "refresh.lock")
+        self.base_version_path = os.path.join(state_dir, "base_version")
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        self._reset()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self):
+        self.seq = 0           # última entrada aplicada en este proceso
+        self.snapshot_seq = 0  # secuencia incluida en el snapshot vigente
+        self.needs_reload = False
+        self.base = None       # origen del documento base: "cloud", "local", "sqlite"...
+        self._pos = 0          # bytes leídos de la bitácora
+        self._epoch = None     # época (primera línea) del archivo leído; None = aún no se lee
+        self._log_stat = None  # stat de la bitácora en la última lectura
+        self._gen_stat = _stat(self.generation_path)  # antes de leer: si cambia en medio, se relee
+        self._generation = self.generation()
+
+    def _after_fork(self):
+        self._lock = threading.RLock()
+
+    def _repair_tail(self):
+        """Recorta una última línea a medias (escritura cortada por un cierre abrupto).
+
+        Se llama con el candado de la bitácora tomado: ahí nadie está escribiendo,
+        así que una línea sin salto final ya no se va a completar. Si se dejara,
+        la siguiente entrada se pegaría a ella y las dos se perderían.
+        """
+        try:
+            f = open(self.log_path, "rb+")
+        except FileNotFoundError:
+            return
+        with f:
+            size = f.seek(0, os.SEEK_END)
+            if not size: return
+            f.seek(size - 1)
+            if f.read(1) == b"\n": return
+            end, block = size, 65536
+            while end > 0:
+                start = max(0, end - block)
+                f.seek(start)
+                cut = f.read(end - start).rfind(b"\n")
+                if cut >= 0:
+                    end = start + cut + 1
+                    break
+                end = start
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+        print(f"🩹 Bitácora: se descartó una línea incompleta ({size - end} bytes).")
+
+    # --- Lectura incremental ---
+    @staticmethod
+    def _read_epoch(f):
+        """Época del archivo abierto ("" si no tiene encabezado: nunca se ha compactado)."""
+        f.seek(0)
+        first = f.readline(512)
+        if first.endswith(b"\n"):
+            try:
+                return json.loads(first).get("epoch") or ""
+            except (ValueError, AttributeError):
+                pass
+        return ""
+
+    def _read_new(self):
+        """Entradas completas agregadas desde la última lectura: (entradas, archivo_reemplazado)."""
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return [], False
+        with f:
+            st = os.fstat(f.fileno())
+            epoch, size = self._read_epoch(f), st.st_size
+            replaced = self._epoch is not None and (epoch != self._epoch or size < self._pos)
+            pos = self._pos if self._epoch is not None and not replaced else 0
+            f.seek(pos)
+            chunk = f.read()
+        # Una línea sin salto final todavía se está escribiendo: se lee la próxima vez
+        end = chunk.rfind(b"\n") + 1
+        self._pos, self._epoch = pos + end, epoch
+        self._log_stat = (st.st_size, st.st_mtime_ns, st.st_ino)
+        return _parse_lines(chunk[:end]), replaced
+
+    def _log_replaced(self):
+        try:
+            with open(self.log_path, "rb") as f:
+                return self._read_epoch(f) != self._epoch
+        except FileNotFoundError:
+            return False
+
+    def _generation_changed(self):
+        """¿Otro proceso publicó un documento base? El contador solo se lee si el archivo cambió."""
+        st = _stat(self.generation_path)
+        if st == self._gen_stat:
+            return False
+        if self.generation() != self._generation:
+            return True
+        self._gen_stat = st
+        return False
+
+    def changed(self):
+        """Revisión barata: ¿algún proceso agregó, compactó o publicó un documento nuevo?"""
+        if self._generation_changed():
+            return True
+        st = _stat(self.log_path)
+        if st is None:
+            return False
+        if self._epoch is None or st[0] != self._pos:
+            return True
+        if st == self._log_stat:
+            return False
+        # Mismo tamaño pero otro mtime: solo falta descartar que sea otro archivo con ese tamaño
+        if self._log_replaced():
+            return True
+        self._log_stat = st
+        return False
+
+    def _catch_up(self, apply):
+        entries, replaced = self._read_new()
+        if replaced:
+            self.snapshot_seq = max(self.snapshot_seq, self._read_snapshot_seq())
+        new = [e for e in entries if e.get("seq", 0) > self.seq]
+        # Si otro proceso compactó entradas que aquí nunca se aplicaron, hay que recargar
+        if (replaced and self.snapshot_seq > self.seq) or (new and new[0]["seq"] != self.seq + 1):
+            self.needs_reload = True
+            self.seq = max([self.seq, self.snapshot_seq] + [e["seq"] for e in new])
+            return
+        for e in new:
+            apply(e)
+            self.seq = e["seq"]
+
+    def sync(self, apply):
+        """Aplica lo que otros procesos agregaron. Devuelve False si hace falta recargar el estado."""
+        with self._lock:
+            if self._generation_changed():
+                self.needs_reload = True
+            elif self.changed():
+                self._catch_up(apply)
+            return not self.needs_reload
+
+    # --- Arranque ---
+    def boot_lock(self):
+        """Un solo proceso arranca a la vez: el primero crea el snapshot y los demás lo reusan."""
+        return file_lock(self.boot_lock_path)
+
+    def has_snapshot(self):
+        return os.path.exists(self.snapshot_path)
+
+    def _read_snapshot_seq(self):
+        try:
+            with open(self.snapshot_seq_path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def load(self, base_loader):
+        """Devuelve (documento, cola): el último snapshot (o base_loader()) y las entradas posteriores.
+
+        base_loader() entrega (documento, origen); el snapshot guarda su propio origen.
+        """
+        with self._lock:
+            self._reset()
+            data = None
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    snap = json.load(f)
+                data = snap["data"]
+                self.snapshot_seq = self.seq = int(snap.get("seq", 0))
+                self.base = snap.get("base", "cloud")
+                print(f"💾 Snapshot local cargado (seq {self.seq}).")
+            except (FileNotFoundError, ValueError, KeyError):
+                pass
+            if data is None:
+                data, self.base = base_loader()
+
+            with file_lock(self.lock_path):
+                self._repair_tail()
+            entries, _ = self._read_new()
+            tail = [e for e in entries if e.get("seq", 0) > self.snapshot_seq]
+            if tail:
+                self.seq = max(self.seq, tail[-1]["seq"])
+            return data, tail
+
+    # --- Escritura ---
+    def append(self, entry, apply):
+        """Agrega una entrada (durable) con la siguiente secuencia global y la devuelve.
+
+        Antes de escribir se aplican con `apply` las entradas de otros procesos,
+        para que el estado local quede al día.
+        """
+        with self._lock, file_lock(self.lock_path):
+            self._repair_tail()
+            self._catch_up(apply)
+            entry["seq"] = self.seq + 1
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            # Con el candado tomado lo único nuevo es la entrada propia: se salta y se toma su secuencia
+            self._read_new()
+            self.seq = entry["seq"]
+            return entry["seq"]
+
+    def needs_compaction(self):
+        return self.seq - self.snapshot_seq >= self.compact_every
+
+    def entries_after(self, seq):
+        """Todas las entradas de la bitácora posteriores a `seq` (lectura completa, fuera del camino caliente)."""
+        try:
+            with open(self.log_path, "rb") as f:
+                chunk = f.read()
+        except FileNotFoundError:
+            return []
+        return [e for e in _parse_lines(chunk) if e.get("seq", 0) > seq]
+
+    def compact(self, data_json, seq, force=False):
+        """Guarda `data_json` (estado hasta `seq`) como snapshot y recorta la bitácora.
+
+        Con force=True se reescribe aunque la secuencia no haya avanzado (documento base nuevo).
+        """
+        with self._lock, file_lock(self.lock_path):
+            current = self._read_snapshot_seq()
+            if not force and seq <= current and self.has_snapshot():
+                self.snapshot_seq = max(self.snapshot_seq, current)
+                return
+            base = json.dumps(self.base)
+            _write_atomic(self.snapshot_path, f'{{"seq": {seq}, "base": {base}, "data": {data_json}}}')
+            _write_atomic(self.snapshot_seq_path, str(seq))
+            keep = self.entries_after(seq)  # las líneas dañadas se descartan aquí
+            header = json.dumps({"epoch": uuid.uuid4().hex, "snapshot_seq": seq})
+            _write_atomic(self.log_path, "".join([header + "\n"] + [json.dumps(e, ensure_ascii=False) + "\n" for e in keep]))
+            self.snapshot_seq = seq
+            # Se relee desde el inicio del archivo nuevo; lo ya aplicado se salta por secuencia
+            self._pos, self._epoch, self._log_stat = 0, None, None
+        print(f"🗜️ Bitácora compactada en snapshot (seq {seq}).")
+
+    def generation(self):
+        try:
+            with open(self.generation_path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def publish(self):
+        """Avisa a los demás procesos que hay un snapshot con documento base nuevo."""
+        with self._lock:
+            generation = self.generation()
+            _write_atomic(self.generation_path, str(generation + 1))
+            self._generation, self._gen_stat = generation + 1, None
+            return generation + 1
+
+    def refresh_lock(self):
+        """Solo un proceso refresca el documento base a la vez (sin bloquear)."""
+        return file_lock(self.refresh_lock_path, blocking=False)
+
+    # --- Versión del documento base ---
+    @property
+    def base_version(self):
+        """Versión (ETag, contador o hash) del documento base que refleja el snapshot."""
+        try:
+            with open(self.base_version_path, "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def mark_base_version(self, version):
+        _write_atomic(self.base_version_path, version or "")
+
+    # --- Hasta dónde llegó la nube ---
+    @property
+    def uploaded_seq(self):
+        try:
+            with open(self.uploaded_path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def mark_uploaded(self, seq):
+        _write_atomic(self.uploaded_path, str(seq))
+
+    def upload_lock(self):
+        """Solo un proceso sube a la vez (sin bloquear: si otro está subiendo, se reintenta luego)."""
+        return file_lock(self.upload_lock_path, blocking=False)
+
+
+# -----------------------------
+# GUARDADO DIFERIDO (WRITE-BEHIND)
+# -----------------------------
+# Los cambios ya quedaron durables en la bitácora; aquí solo se agenda la
+# subida. Una ráfaga de cambios dentro de la ventana de espera termina en UNA
+# sola subida, y si falla se reintenta más tarde.
+
+
+class WriteBehindSaver:
+    """Sube el documento en segundo plano, agrupando ráfagas de cambios."""
+
+    def __init__(self, save, debounce=5.0, retry=30.0):
+        # save() -> bool: toma su propio snapshot consistente y lo guarda
+        self.save = save
+        self.debounce = debounce
+        self.retry = retry
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._due = None  # momento (monotonic) en que toca subir
+        self._closed = False
+        self._thread = None
+        atexit.register(self.close)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # El hilo de subida no sobrevive al fork (gunicorn con preload_app): se recrea en el hijo
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        if self._due is not None:
+            with self._lock:
+                self._schedule(0)
+
+    def mark_dirty(self):
+        """Agenda una subida; las llamadas dentro de la misma ventana se agrupan."""
+        with self._lock:
+            self._schedule(self.debounce)
+
+    def _schedule(self, delay):
+        if self._closed: return
+        due = time.monotonic() + delay
+        # La primera escritura de una ráfaga fija el plazo; las siguientes se suman a esa subida
+        if self._due is None or due < self._due:
+            self._due = due
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+        self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and (self._due is None or self._due > time.monotonic()):
+                    timeout = None if self._due is None else self._due - time.monotonic()
+                    self._cond.wait(timeout)
+                if self._closed: return
+            self.flush()
+
+    def flush(self):
+        """Sube el estado actual si hay cambios pendientes. Devuelve True si quedó todo guardado."""
+        with self._flush_lock:
+            with self._lock:
+                if self._due is None: return True
+                self._due = None
+
+            ok = False
+            try:
+                ok = self.save()
+            except Exception as e:
+                print(f"❌ Error en guardado diferido: {e}")
+
+            if not ok:
+                with self._lock:
+                    self._schedule(self.retry)
+            return ok
+
+    def close(self):
+        """Último intento de subida al apagar el proceso."""
+        if self._closed: return
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._cond.notify_all()
@@ -0,0 +1,146 @@
+import heapq
+from math import radians, sin, cos, asin, sqrt, floor
+
+try:
+    import numpy as np
+except ImportError:  # Sin NumPy se usa el cálculo escalar
+    np = None
+
+# -----------------------------
+# ÍNDICE ESPACIAL (CUBETAS DE CUADRÍCULA)
+# -----------------------------
+# Los lugares se agrupan en celdas de CELL_DEG grados. "Los k más cercanos"
+# revisa anillos de celdas alrededor del usuario y se detiene en cuanto
+# ninguna celda sin revisar puede tener algo más cerca que el k-ésimo.
+# Si el usuario está lejos de todo (otro país, un GPS falso) los anillos
+# serían casi todos celdas vacías: pasado cierto número se hace una sola
+# pasada vectorizada sobre todos los lugares.
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG = 111.19
+CELL_DEG = 0.1  # ~11 km por lado en Campeche
+
+
+def haversine_many(lat, lng, lats, lngs):
+    """Distancias en km desde (lat, lng) a cada punto; vectorizado con NumPy si existe."""
+    if np is not None:
+        lats = np.radians(np.asarray(lats, dtype=float))
+        lngs = np.radians(np.asarray(lngs, dtype=float))
+        lat, lng = radians(lat), radians(lng)
+        a = np.sin((lats - lat) / 2) ** 2 + cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))).tolist()
+
+    out = []
+    rlat, rlng = radians(lat), radians(lng)
+    for p_lat, p_lng in zip(lats, lngs):
+        p_lat, p_lng = radians(p_lat), radians(p_lng)
+        a = sin((p_lat - rlat) / 2) ** 2 + cos(rlat) * cos(p_lat) * sin((p_lng - rlng) / 2) ** 2
+        out.append(2 * EARTH_RADIUS_KM * asin(sqrt(min(a, 1.0))))
+    return out
+
+
+def coords_of(item):
+    """Extrae (lat, lng) de un lugar del JSON, o None si no tiene coordenadas."""
+    coords = item.get("coordenadas") or {}
+    try:
+        return float(coords["lat"]), float(coords["lng"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class SpatialIndex:
+    """Cuadrícula de lugares con consulta de vecinos más cercanos."""
+
+    def __init__(self, cell_deg=CELL_DEG):
+        self.cell_deg = cell_deg
+        self.cells = {}
+        self.items = []
+        self.lats = []
+        self.lngs = []
+        self.pos = {}
+        self.bounds = None  # (i_min, i_max, j_min, j_max) de celdas ocupadas
+        self.max_abs_lat = 0.0
+
+    def __len__(self):
+        return len(self.items)
+
+    def _cell(self, lat, lng):
+        return floor(lat / self.cell_deg), floor(lng / self.cell_deg)
+
+    def add(self, key, item, lat, lng):
+        # Las consultas no toman candado: primero los datos y los límites, al final
+        # la entrada en la celda, así nunca se ve un índice sin su lugar
+        i, j = self._cell(lat, lng)
+        self.max_abs_lat = max(self.max_abs_lat, abs(lat))
+        if self.bounds is None:
+            self.bounds = (i, i, j, j)
+        else:
+            i0, i1, j0, j1 = self.bounds
+            self.bounds = (min(i0, i), max(i1, i), min(j0, j), max(j1, j))
+        index = len(self.items)
+        self.lats.append(lat)
+        self.lngs.append(lng)
+        self.items.append(item)
+        self.pos[key] = index
+        self.cells.setdefault((i, j), []).append(index)
+
+    def _ring(self, ci, cj, r):
+        if r == 0:
+            yield ci, cj
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield ci - r, j
+            yield ci + r, j
+        for i in range(ci - r + 1, ci + r):
+            yield i, cj - r
+            yield i, cj + r
+
+    def nearest(self, lat, lng, k, where=None):
+        """Los k elementos más cercanos como lista de (distancia_km, item), sin modificar nada."""
+        if not self.items or k <= 0:
+            return []
+        if k >= len(self.items):
+            return self._nearest_all(lat, lng, k, where)
+
+        ci, cj = self._cell(lat, lng)
+        i0, i1, j0, j1 = self.bounds
+        max_ring = max(abs(ci - i0), abs(ci - i1), abs(cj - j0), abs(cj - j1))
+        # Km mínimos por celda (la longitud se encoge con la latitud)
+        cell_km = self.cell_deg * KM_PER_DEG * cos(radians(min(90.0, max(abs(lat), self.max_abs_lat)))) * 0.99
+
+        found, best = [], []
+        visited, budget = 0, max(len(self.cells), 9)
+        for r in range(max_ring + 1):
+            # Más celdas revisadas que celdas ocupadas: conviene ver todo de una vez
+            visited += 8 * r or 1
+            if visited > budget:
+                return self._nearest_all(lat, lng, k, where)
+            ring = []
+            for cell in self._ring(ci, cj, r):
+                for idx in self.cells.get(cell, ()):
+                    if where is None or where(self.items[idx]):
+                        ring.append(idx)
+            if ring:
+                dists = haversine_many(lat, lng, [self.lats[i] for i in ring], [self.lngs[i] for i in ring])
+                found.extend(zip(dists, ring))
+                best = heapq.nsmallest(k, found)
+                found = best
+            # Lo que falta revisar está a más de r celdas de distancia
+            if len(best) >= k and best[-1][0] <= r * cell_km:
+                break
+
+        return [(d, self.items[idx]) for d, idx in best]
+
+    def _nearest_all(self, lat, lng, k, where=None):
+        """Los k más cercanos con una sola pasada (vectorizada) sobre todos los elementos."""
+        n = len(self.items)  # lats/lngs se agregan antes que items (ver add)
+        idxs = range(n) if where is None else [i for i in range(n) if where(self.items[i])]
+        dists = haversine_many(lat, lng, [self.lats[i] for i in idxs], [self.lngs[i] for i in idxs])
+        return [(d, self.items[i]) for d, i in heapq.nsmallest(k, zip(dists, idxs))]
+
+    def distances(self, lat, lng, keys, default=9999.0):
+        """Distancia a cada llave indicada; `default` para las que no tienen coordenadas."""
+        idxs = [self.pos.get(k) for k in keys]
+        known = [i for i in idxs if i is not None]
+        dists = iter(haversine_many(lat, lng, [self.lats[i] for i in known], [self.lngs[i] for i in known]))
+        return [next(dists) if i is not None else default for i in idxs]
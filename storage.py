@@ -0,0 +1,434 @@
+import os
+import sys
+import json
+import hashlib
+import sqlite3
+import http_client
+from cache import FLIGHTS
+from breaker import breaker
+from contextlib import contextmanager
+from catalog import iter_raw_places, make_place_id, normalize_name, sort_reviews, strip_transient
+
+# -----------------------------
+# ALMACENAMIENTO CONFIGURABLE
+# -----------------------------
+# Todas las opciones exponen la misma interfaz:
+#   load() -> dict | None   (el documento completo, como campeche.json)
+#   save(data) -> bool      (data puede ser el dict o el JSON ya serializado)
+#   append_entries(entries) -> bool  (opcional: guarda solo las reseñas nuevas de la bitácora)
+#   enabled                 (False si no hay dónde guardar)
+#   remote                  (True si cargar implica ir por red: se hace en segundo plano)
+#   version() -> str | None (revisión barata de metadatos: cambia cuando cambia el contenido)
+# Se elige con NAAJ_STORAGE = jsonbin | sqlite | local.
+
+
+def content_version(data):
+    """Versión derivada del contenido, para cuando el almacenamiento no da metadatos."""
+    body = json.dumps(data, ensure_ascii=False, sort_keys=True)
+    return "sha1:" + hashlib.sha1(body.encode("utf-8")).hexdigest()
+
+
+def file_version(*paths):
+    """Versión de uno o más archivos a partir de os.stat (tamaño y fecha de modificación)."""
+    parts = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+        except FileNotFoundError:
+            parts.append("-")
+    return "file:" + "/".join(parts)
+
+
+class JsonBinStorage:
+    """Documento completo en JSONBin."""
+
+    name = "jsonbin"
+
+    def __init__(self, api_key, bin_id, base_url="https://api.jsonbin.io/v3"):
+        self.api_key = api_key
+        self.bin_id = bin_id
+        self.base_url = base_url.rstrip("/")
+        # Si JSONBin está caído o lento se deja de intentar un rato (la bitácora local guarda todo)
+        self.breaker = breaker("jsonbin", slow_call_seconds=15, open_seconds=60)
+
+    @property
+    def enabled(self):
+        return bool(self.api_key and self.bin_id)
+
+    @property
+    def remote(self):
+        return self.enabled
+
+    def _call(self, fn):
+        """Llamada a JSONBin a través del breaker; los 5xx también cuentan como falla."""
+        def checked():
+            response = fn()
+            if response.status_code >= 500:
+                raise RuntimeError(f"JSONBin respondió {response.status_code}")
+            return response
+        return self.breaker.call(checked)
+
+    def load(self, timeout=(5, 30)):
+        """Carga los datos desde JSONBin. Devuelve None si no se pudo."""
+        print("☁️ Cargando datos desde la nube...")
+        if not self.enabled:
+            print("⚠️ Faltan credenciales de JSONBin. Usando modo local.")
+            return None
+
+        url = f"{self.base_url}/b/{self.bin_id}"
+        headers = {"X-Master-Key": self.api_key}
+        try:
+            # Descargas simultáneas del mismo bin comparten una sola respuesta
+            response = FLIGHTS.do(("jsonbin", url), lambda: self._call(lambda: http_client.get(url, headers=headers, timeout=timeout)))
+            if response.status_code == 200:
+                # JSONBin devuelve los datos dentro de la llave "record" (cada quien parsea su copia)
+                data = response.json().get("record", {})
+                print("✅ Datos cargados exitosamente desde JSONBin.")
+                return data
+            print(f"⚠️ Error cargando nube ({response.status_code}). Usando local.")
+        except Exception as e:
+            print(f"❌ Error conexión nube: {e}")
+        return None
+
+    def version(self, timeout=(5, 10)):
+        """Contador de versiones del bin (solo metadatos, sin descargar el documento)."""
+        if not self.enabled: return None
+        url = f"{self.base_url}/b/{self.bin_id}/versions/count"
+        try:
+            response = self._call(lambda: http_client.get(url, headers={"X-Master-Key": self.api_key}, timeout=timeout))
+            if response.status_code == 200:
+                return f"jsonbin:{response.json()['metadata']['versionCount']}"
+        except Exception as e:
+            print(f"⚠️ No se pudo consultar la versión en JSONBin: {e}")
+        return None
+
+    def save(self, data):
+        """Guarda los cambios en JSONBin para persistencia real. Devuelve True si se guardó."""
+        if not self.enabled:
+            print("⚠️ No se puede guardar en la nube: Faltan credenciales.")
+            return False
+
+        print("☁️ Guardando cambios en la nube...")
+        url = f"{self.base_url}/b/{self.bin_id}"
+        headers = {
+            "Content-Type": "application/json",
+            "X-Master-Key": self.api_key
+        }
+        body = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+        try:
+            # PUT actualiza el contenido del Bin existente
+            response = self._call(lambda: http_client.put(url, data=body.encode("utf-8"), headers=headers, timeout=(5, 60)))
+            if response.status_code == 200:
+                print("✅ Base de datos actualizada en JSONBin.")
+                return True
+            print(f"⚠️ Error al guardar en JSONBin: {response.status_code}")
+        except Exception as e:
+            print(f"❌ Error guardando en nube: {e}")
+        return False
+
+
+class LocalJsonStorage:
+    """Archivo JSON local (campeche.json). Solo lectura: los cambios viven en la bitácora."""
+
+    name = "local"
+    enabled = False
+    remote = False
+
+    def __init__(self, path="campeche.json"):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def version(self):
+        return file_version(self.path)
+
+    def save(self, data):
+        return False
+
+
+# -----------------------------
+# SQLITE (WAL)
+# -----------------------------
+# Solo almacenamiento: lugares, reseñas y directorios de transporte en tablas
+# de un archivo que todos los workers comparten (modo WAL). Las consultas no
+# van a SQL: cada worker arma su catálogo en memoria (índices, distancias y
+# rankings) con load(). Cada reseña se guarda como una fila nueva
+# (append_entries); el documento completo solo se reescribe al importar o al
+# cambiar el documento base.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS municipios (
+    key   TEXT PRIMARY KEY,
+    seq   INTEGER NOT NULL,
+    nombre_oficial TEXT,
+    data  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transporte (
+    municipio TEXT NOT NULL,
+    campo     TEXT NOT NULL,
+    data      TEXT NOT NULL,
+    PRIMARY KEY (municipio, campo)
+);
+CREATE TABLE IF NOT EXISTS places (
+    rowid     INTEGER PRIMARY KEY,
+    id        TEXT UNIQUE NOT NULL,
+    grupo     TEXT NOT NULL,
+    municipio TEXT,
+    seccion   TEXT,
+    nombre    TEXT NOT NULL,
+    key       TEXT,
+    categoria TEXT,
+    direccion TEXT,
+    lat       REAL,
+    lng       REAL,
+    rating    REAL,
+    data      TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reviews (
+    rowid    INTEGER PRIMARY KEY,
+    place_id TEXT NOT NULL,
+    pos      INTEGER NOT NULL,
+    rating   REAL,
+    date     TEXT,
+    data     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reviews_place ON reviews (place_id, pos);
+"""
+
+# Llaves del documento que viven en tablas propias
+TABLE_KEYS = {"municipios_data", "restaurantes_famosos", "lugares_comunidad", "puntos_interes_recomendados"}
+TRANSPORT_KEYS = ("directorio_transporte", "datos_transporte")
+
+
+def _float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SqliteStorage:
+    """Documento guardado en un archivo SQLite compartido por todos los workers."""
+
+    name = "sqlite"
+    enabled = True
+    remote = False
+
+    def __init__(self, path, seed_path="campeche.json"):
+        self.path = path
+        self.seed_path = seed_path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+
+    def _migrate(self, conn):
+        # Bases creadas antes de la columna `key` (nombre normalizado, para ubicar el lugar de una reseña)
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(places)")}
+        if "key" not in columns:
+            conn.execute("ALTER TABLE places ADD COLUMN key TEXT")
+            rows = conn.execute("SELECT rowid, nombre FROM places").fetchall()
+            conn.executemany("UPDATE places SET key = ? WHERE rowid = ?",
+                             [(normalize_name(r["nombre"]), r["rowid"]) for r in rows])
+        conn.execute("CREATE INDEX IF NOT EXISTS places_key ON places (key)")
+        # Índices de las consultas en SQL que ya no existen (se mantenían en cada escritura)
+        conn.execute("DROP TABLE IF EXISTS places_fts")
+        conn.execute("DROP INDEX IF EXISTS places_municipio")
+        conn.execute("DROP INDEX IF EXISTS places_rating")
+
+    @contextmanager
+    def connect(self):
+        """Conexión corta: confirma la transacción al salir y se cierra."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- Interfaz común ---
+    def load(self):
+        with self.connect() as conn:
+            empty = conn.execute("SELECT COUNT(*) FROM meta").fetchone()[0] == 0
+        if empty:
+            seed = LocalJsonStorage(self.seed_path).load()
+            if seed is None: return None
+            print(f"📥 Importando {self.seed_path} a SQLite...")
+            self.save(seed)
+        return self.read_document()
+
+    def version(self):
+        # Con WAL los cambios confirmados viven en el archivo -wal hasta el checkpoint
+        return file_version(self.path, self.path + "-wal")
+
+    def save(self, data):
+        """Reemplaza el contenido de las tablas con el documento en una sola transacción."""
+        if isinstance(data, str): data = json.loads(data)
+        try:
+            with self.connect() as conn:
+                self._write_document(conn, data)
+            return True
+        except sqlite3.Error as e:
+            print(f"❌ Error guardando en SQLite: {e}")
+            return False
+
+    def append_entries(self, entries):
+        """Guarda solo las reseñas de la bitácora: una fila por reseña, sin reescribir el documento."""
+        try:
+            with self.connect() as conn:
+                for entry in entries:
+                    if entry.get("op") == "review": self._write_review(conn, entry)
+            return True
+        except sqlite3.Error as e:
+            print(f"❌ Error guardando en SQLite: {e}")
+            return False
+
+    # --- Reseñas sueltas ---
+    def _write_review(self, conn, entry):
+        # Mismo criterio que el catálogo: con nombres repetidos gana el primero
+        key = normalize_name(entry["place_name"])
+        row = conn.execute("SELECT id FROM places WHERE key = ? ORDER BY rowid LIMIT 1", (key,)).fetchone()
+        place_id = row["id"] if row else self._insert_community_place(conn, key, entry["new_place"])
+
+        review = entry["review"]
+        if review.get("id") and conn.execute(
+                "SELECT 1 FROM reviews WHERE place_id = ? AND json_extract(data, '$.id') = ?",
+                (place_id, review["id"])).fetchone():
+            return  # ya estaba (la bitácora puede repetir reseñas)
+        # Las nuevas van antes que todas (pos menor), igual que Place.add_review
+        conn.execute(
+            "INSERT INTO reviews (place_id, pos, rating, date, data) "
+            "VALUES (?, (SELECT COALESCE(MIN(pos), 0) - 1 FROM reviews WHERE place_id = ?), ?, ?, ?)",
+            (place_id, place_id, _float_or_none(review.get("rating")), review.get("date"),
+             json.dumps(review, ensure_ascii=False)))
+        # Mismo promedio que RatingStats (una reseña sin rating cuenta como 0)
+        count, total = conn.execute("SELECT COUNT(*), TOTAL(rating) FROM reviews WHERE place_id = ?",
+                                    (place_id,)).fetchone()
+        rating = round(total / count, 1)
+        conn.execute("UPDATE places SET rating = ?, data = json_set(data, '$.rating', ?) WHERE id = ?",
+                     (rating, rating, place_id))
+
+    def _insert_community_place(self, conn, key, item):
+        """Alta de un lugar de 'lugares_comunidad' (al final, como en el catálogo)."""
+        base = make_place_id("lugares_comunidad", None, key)
+        taken = {r["id"] for r in conn.execute("SELECT id FROM places WHERE id LIKE ?", (base + "%",))}
+        place_id = make_place_id("lugares_comunidad", None, key, taken)
+        self._insert_place(conn, None, place_id, "lugares_comunidad", None, None, item)
+        return place_id
+
+    def _insert_place(self, conn, rowid, place_id, grupo, municipio, seccion, item):
+        coords = item.get("coordenadas") or {}
+        rest = {k: v for k, v in item.items() if k != "reviews"}
+        strip_transient(rest)
+        conn.execute(
+            "INSERT INTO places (rowid, id, grupo, municipio, seccion, nombre, key, categoria, direccion, lat, lng, rating, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (rowid, place_id, grupo, municipio, seccion, item.get("nombre", ""), normalize_name(item.get("nombre")),
+             item.get("categoria"), item.get("direccion"),
+             _float_or_none(coords.get("lat")), _float_or_none(coords.get("lng")),
+             _float_or_none(item.get("rating")), json.dumps(rest, ensure_ascii=False)))
+
+    # --- Documento <-> tablas ---
+    def _write_document(self, conn, data):
+        for table in ("meta", "municipios", "transporte", "places", "reviews"):
+            conn.execute(f"DELETE FROM {table}")
+
+        for key, value in data.items():
+            if key not in TABLE_KEYS:
+                conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value, ensure_ascii=False)))
+        # Orden de las secciones (para reconstruir listas vacías tal cual)
+        conn.execute("INSERT INTO meta (key, value) VALUES ('_puntos_keys', ?)",
+                     (json.dumps(list(data.get("puntos_interes_recomendados", {}).keys()), ensure_ascii=False),))
+
+        for seq, (mun_key, m_data) in enumerate(data.get("municipios_data", {}).items()):
+            rest = {k: v for k, v in m_data.items() if k != "lugares" and k not in TRANSPORT_KEYS}
+            conn.execute("INSERT INTO municipios (key, seq, nombre_oficial, data) VALUES (?, ?, ?, ?)",
+                         (mun_key, seq, m_data.get("nombre_oficial"), json.dumps(rest, ensure_ascii=False)))
+            for campo in TRANSPORT_KEYS:
+                if campo in m_data:
+                    conn.execute("INSERT INTO transporte (municipio, campo, data) VALUES (?, ?, ?)",
+                                 (mun_key, campo, json.dumps(m_data[campo], ensure_ascii=False)))
+
+        # Mismos ids que el catálogo en memoria (mismo recorrido y misma regla), sin tocar `data`
+        taken = set()
+        for seq, (grupo, municipio, seccion, item) in enumerate(iter_raw_places(data)):
+            place_id = make_place_id(grupo, municipio, normalize_name(item.get("nombre")), taken)
+            taken.add(place_id)
+            self._insert_place(conn, seq + 1, place_id, grupo, municipio, seccion, item)
+            reviews = list(item.get("reviews") or [])
+            sort_reviews(reviews)
+            for pos, review in enumerate(reviews):
+                conn.execute("INSERT INTO reviews (place_id, pos, rating, date, data) VALUES (?, ?, ?, ?, ?)",
+                             (place_id, pos, _float_or_none(review.get("rating")), review.get("date"),
+                              json.dumps(review, ensure_ascii=False)))
+
+    def read_document(self):
+        """Reconstruye el documento con la misma forma que campeche.json."""
+        with self.connect() as conn:
+            meta = {r["key"]: json.loads(r["value"]) for r in conn.execute("SELECT key, value FROM meta")}
+            puntos_keys = meta.pop("_puntos_keys", [])
+            data = dict(meta)
+            data["municipios_data"] = {}
+            for r in conn.execute("SELECT key, data FROM municipios ORDER BY seq"):
+                data["municipios_data"][r["key"]] = dict(json.loads(r["data"]), lugares=[])
+            for r in conn.execute("SELECT municipio, campo, data FROM transporte"):
+                data["municipios_data"].setdefault(r["municipio"], {"lugares": []})[r["campo"]] = json.loads(r["data"])
+            data["restaurantes_famosos"] = []
+            data["lugares_comunidad"] = []
+            data["puntos_interes_recomendados"] = {k: [] for k in puntos_keys}
+
+            reviews = {}
+            for r in conn.execute("SELECT place_id, data FROM reviews ORDER BY place_id, pos"):
+                reviews.setdefault(r["place_id"], []).append(json.loads(r["data"]))
+
+            for r in conn.execute("SELECT id, grupo, municipio, seccion, data FROM places ORDER BY rowid"):
+                item = json.loads(r["data"])
+                item["reviews"] = reviews.get(r["id"], [])
+                if r["grupo"] == "municipios_data":
+                    data["municipios_data"].setdefault(r["municipio"], {"lugares": []})["lugares"].append(item)
+                elif r["grupo"] == "puntos_interes_recomendados":
+                    data["puntos_interes_recomendados"].setdefault(r["seccion"], []).append(item)
+                else:
+                    data[r["grupo"]].append(item)
+        return data
+
+
+def storage_from_env(state_dir="naaj_state"):
+    """Crea el almacenamiento indicado por NAAJ_STORAGE (por defecto JSONBin)."""
+    kind = os.getenv("NAAJ_STORAGE", "jsonbin").lower()
+    if kind == "sqlite":
+        return SqliteStorage(os.getenv("NAAJ_SQLITE_PATH", os.path.join(state_dir, "naaj.db")))
+    if kind == "local":
+        return LocalJsonStorage()
+    storage = JsonBinStorage(os.getenv("JSONBIN_API_KEY"), os.getenv("JSONBIN_BIN_ID"),
+                             os.getenv("JSONBIN_BASE_URL", "https://api.jsonbin.io/v3"))
+    if not storage.enabled:
+        print("⚠️ Faltan credenciales de JSONBin. Usando modo local.")
+        return LocalJsonStorage()
+    return storage
+
+
+if __name__ == "__main__":
+    # Uso: python storage.py import [campeche.json] [naaj_state/naaj.db]
+    if len(sys.argv) < 2 or sys.argv[1] != "import":
+        print("Uso: python storage.py import [archivo.json] [base.db]")
+        sys.exit(1)
+    json_path = sys.argv[2] if len(sys.argv) > 2 else "campeche.json"
+    db_path = sys.argv[3] if len(sys.argv) > 3 else os.path.join("naaj_state", "naaj.db")
+    with open(json_path, "r", encoding="utf-8") as f:
+        document = json.load(f)
+    SqliteStorage(db_path).save(document)
+    print(f"✅ {json_path} importado en {db_path}")
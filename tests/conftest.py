@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos viven sueltos en la raíz del repo (junto a app.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
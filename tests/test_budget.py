@@ -0,0 +1,53 @@
+import multiprocessing
+
+import pytest
+
+from budget import BudgetExceeded, GOOGLE_COSTS, QuotaBudget
+
+# Ritmo muy alto: aquí solo se prueba el tope de gasto compartido
+RATES = {endpoint: (10_000, 10_000) for endpoint in GOOGLE_COSTS}
+DAILY_LIMIT = 0.5
+PROCESSES = 4
+CALLS_PER_PROCESS = 20
+
+
+def spend_many(path, barrier, results):
+    budget = QuotaBudget(path, rates=RATES, daily_limit=DAILY_LIMIT)
+    barrier.wait()  # todos empiezan a gastar al mismo tiempo
+    spent = 0
+    for _ in range(CALLS_PER_PROCESS):
+        try:
+            budget.spend("textsearch")
+            spent += 1
+        except BudgetExceeded:
+            pass
+    results.put(spent)
+
+
+def test_daily_ceiling_holds_across_processes(tmp_path):
+    path = str(tmp_path / "budget.db")
+    QuotaBudget(path, rates=RATES, daily_limit=DAILY_LIMIT)  # crea el esquema antes de la carrera
+    ctx = multiprocessing.get_context("fork")
+    barrier, results = ctx.Barrier(PROCESSES), ctx.Queue()
+    procs = [ctx.Process(target=spend_many, args=(path, barrier, results)) for _ in range(PROCESSES)]
+    for p in procs: p.start()
+    spent = sum(results.get(timeout=60) for _ in procs)
+    for p in procs: p.join(timeout=60)
+
+    cost = GOOGLE_COSTS["textsearch"]
+    allowed = int(DAILY_LIMIT / cost + 1e-9)
+    assert PROCESSES * CALLS_PER_PROCESS > allowed  # la carrera sí intenta pasarse del tope
+    assert spent == allowed
+    budget = QuotaBudget(path, rates=RATES, daily_limit=DAILY_LIMIT)
+    assert budget.today_cost() <= DAILY_LIMIT
+    assert budget.today_cost() == pytest.approx(allowed * cost)
+
+
+def test_rate_limit_denies_without_spending(tmp_path):
+    rates = dict(RATES, details=(0.001, 1))
+    budget = QuotaBudget(str(tmp_path / "budget.db"), rates=rates, daily_limit=DAILY_LIMIT)
+    budget.spend("details")
+    with pytest.raises(BudgetExceeded):
+        budget.spend("details")
+    assert budget.today_cost() == pytest.approx(GOOGLE_COSTS["details"])
+    assert budget.denied["details"]["rate"] == 1
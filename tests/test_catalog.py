@@ -0,0 +1,81 @@
+from catalog import Catalog, Place
+
+
+def make_place(n):
+    reviews = [{"id": f"r{i}", "rating": 5, "date": f"2024-01-{i + 1:02d}"} for i in range(n)]
+    # El documento guarda las reseñas de la más nueva a la más vieja
+    return Place("p", 0, "restaurantes_famosos", "Campeche", "", {"nombre": "Lugar", "reviews": reviews[::-1]})
+
+
+def ids(page):
+    return [r["id"] for r in page]
+
+
+def test_reviews_page_walks_from_newest_to_oldest():
+    place = make_place(7)
+    page, cursor = place.reviews_page(limit=3)
+    assert ids(page) == ["r6", "r5", "r4"] and cursor == 3
+    page, cursor = place.reviews_page(cursor, 3)
+    assert ids(page) == ["r3", "r2", "r1"] and cursor == 0
+    page, cursor = place.reviews_page(cursor, 3)
+    assert ids(page) == ["r0"] and cursor is None
+
+
+def test_reviews_page_cursor_is_stable_when_reviews_arrive():
+    place = make_place(5)
+    page, cursor = place.reviews_page(limit=2)
+    assert ids(page) == ["r4", "r3"]
+    assert place.add_review({"id": "r5", "rating": 1, "date": "2024-02-01"})
+    assert ids(place.reviews_page(limit=1)[0]) == ["r5"]
+    page, cursor = place.reviews_page(cursor, 2)
+    assert ids(page) == ["r2", "r1"] and cursor == 0
+
+
+def test_reviews_page_edges():
+    place = make_place(3)
+    assert ids(place.reviews_page(99, 2)[0]) == ["r2", "r1"]  # cursor viejo más allá del final
+    assert place.reviews_page(-1, 2) == ([], None)
+    assert make_place(0).reviews_page() == ([], None)
+
+
+def test_document_keeps_newest_first_when_saved():
+    reviews = [{"id": f"r{i}", "rating": 5, "date": f"2024-01-0{i + 1}"} for i in range(3)]
+    catalog = Catalog({"restaurantes_famosos": [{"nombre": "Lugar", "reviews": reviews[::-1]}]})
+    catalog.add_review(catalog.find("Lugar"), {"id": "r3", "rating": 3, "date": "2024-01-05"})
+    saved = catalog.to_document()["restaurantes_famosos"][0]["reviews"]
+    assert ids(saved) == ["r3", "r2", "r1", "r0"]
+
+
+def ranked_names(catalog, **scope):
+    return [p.nombre for p in catalog.top_rated(10, **scope)]
+
+
+def test_rankings_update_reorders_every_view():
+    catalog = Catalog({"municipios_data": {"Calkiní": {"lugares": [
+        {"nombre": "A", "categoria": "Mariscos", "rating": 4.0, "reviews": [{"rating": 4}]},
+        {"nombre": "B", "categoria": "Mariscos", "rating": 3.0, "reviews": [{"rating": 3}]},
+        {"nombre": "C", "categoria": "Museo", "rating": 5.0, "reviews": [{"rating": 5}]},
+    ]}}})
+    assert ranked_names(catalog) == ["C", "A", "B"]
+    b = catalog.find("B")
+    for i in range(3):
+        catalog.add_review(b, {"id": f"b{i}", "rating": 5})
+    assert ranked_names(catalog) == ["C", "B", "A"]
+    assert ranked_names(catalog, municipio="calkini", categoria="mariscos") == ["B", "A"]
+    assert ranked_names(catalog, grupo="municipios_data") == ["C", "B", "A"]
+    # Una reseña repetida no cambia nada
+    assert not catalog.add_review(b, {"id": "b0", "rating": 1})
+    assert ranked_names(catalog, categoria="mariscos") == ["B", "A"]
+
+
+def test_rankings_list_a_repeated_name_once():
+    catalog = Catalog({
+        "restaurantes_famosos": [{"nombre": "Edzná", "rating": 4.8}],
+        "puntos_interes_recomendados": {"zonas arqueologicas": [{"nombre": "Edzná", "rating": 4.8}]},
+    })
+    assert len(catalog) == 2
+    assert ranked_names(catalog) == ["Edzná"]
+    place = catalog.find("Edzná")
+    assert catalog.top_rated(10) == [place]
+    assert catalog.add_review(place, {"id": "e1", "rating": 1})
+    assert catalog.top_rated(10) == [place]
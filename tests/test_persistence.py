@@ -0,0 +1,101 @@
+import json
+
+from persistence import ReviewLog
+
+
+def new_log(state_dir, **options):
+    log = ReviewLog(str(state_dir), **options)
+    log.load(lambda: ({}, "local"))
+    return log
+
+
+def append(log, n):
+    return log.append({"op": "review", "n": n}, lambda entry: None)
+
+
+def log_lines(log):
+    with open(log.log_path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_torn_tail_is_dropped_on_load(tmp_path):
+    log = new_log(tmp_path)
+    append(log, 1)
+    append(log, 2)
+    with open(log.log_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "review", "n": 3, "se')  # el proceso murió a media escritura
+
+    restarted = ReviewLog(str(tmp_path))
+    _, tail = restarted.load(lambda: ({}, "local"))
+    assert [e["seq"] for e in tail] == [1, 2]
+    assert append(restarted, 3) == 3
+    assert append(restarted, 4) == 4
+    assert [e["seq"] for e in log_lines(restarted)] == [1, 2, 3, 4]
+
+
+def test_append_repairs_tail_left_by_another_process(tmp_path):
+    log = new_log(tmp_path)
+    append(log, 1)
+    with open(log.log_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "rev')
+    assert append(log, 2) == 2
+    assert log.seq == 2
+    assert [e["n"] for e in log_lines(log)] == [1, 2]
+
+
+def test_compact_skips_damaged_lines(tmp_path):
+    log = new_log(tmp_path)
+    for n in range(1, 4):
+        append(log, n)
+    with open(log.log_path, "a", encoding="utf-8") as f:
+        f.write("esto no es json\n")
+    append(log, 4)
+
+    log.compact("{}", 2)
+    assert log.entries_after(0) == [
+        {"op": "review", "n": 3, "seq": 3},
+        {"op": "review", "n": 4, "seq": 4},
+    ]
+    log.compact("{}", 4)  # una segunda compactación tampoco falla
+    assert log.entries_after(0) == []
+
+    restarted = ReviewLog(str(tmp_path))
+    data, tail = restarted.load(lambda: ({}, "local"))
+    assert (data, tail, restarted.seq) == ({}, [], 4)
+
+
+def test_other_process_sees_appends_and_compactions(tmp_path):
+    writer, reader = new_log(tmp_path, compact_every=3), new_log(tmp_path)
+    applied = []
+    append(writer, 1)
+    assert reader.changed()
+    assert reader.sync(applied.append)
+    assert [e["seq"] for e in applied] == [1] and not reader.changed()
+
+    for n in range(2, 9):
+        append(writer, n)
+        if writer.needs_compaction():
+            writer.compact("{}", writer.seq)
+    # Otro archivo (aunque tuviera el mismo inode) con más bytes de los que ya se leyeron
+    assert reader.changed()
+    assert not reader.sync(applied.append)
+    assert reader.needs_reload
+
+
+def test_changed_reads_files_only_after_they_change(tmp_path, monkeypatch):
+    writer, reader = new_log(tmp_path), new_log(tmp_path)
+    append(writer, 1)
+    reader.sync(lambda entry: None)
+    assert not reader.changed()
+
+    reads = []
+    monkeypatch.setattr(reader, "generation", lambda: reads.append("generation") or 0)
+    monkeypatch.setattr(reader, "_log_replaced", lambda: reads.append("epoch") or False)
+    for _ in range(100):
+        assert not reader.changed()
+    assert reads == []
+    monkeypatch.undo()
+
+    writer.publish()
+    assert reader.changed()
+    assert not reader.sync(lambda entry: None)
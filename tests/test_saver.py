@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from fakes import JsonBinHandler, fake_env, start_fakes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLACE = "La Pigua"
+
+# Arranca la app (con sus hilos) contra el JSONBin falso, manda reseñas y termina
+# normal (flush al salir) o "se cae" con os._exit antes de que toque subir.
+CLIENT = textwrap.dedent("""
+    import os, sys, time
+    import app
+
+    def wait(check, seconds=15):
+        deadline = time.monotonic() + seconds
+        while not check():
+            if time.monotonic() > deadline: sys.exit("timeout")
+            time.sleep(0.05)
+
+    wait(lambda: app.DATASET_REFRESH["status"] == "ok")
+    client = app.app.test_client()
+    for i in range(int(os.environ["REVIEWS"])):
+        r = client.post("/review", json={"place_name": "%s", "rating": 5, "comment": f"r{i}"})
+        assert r.status_code == 200, r.json
+    if os.environ.get("CRASH"):
+        os._exit(1)
+    wait(lambda: app.REVIEW_LOG.uploaded_seq >= app.REVIEW_LOG.seq)
+    if os.environ.get("REFRESH"):
+        # La versión que dejó la subida es la propia: el refresco no debe descargarla
+        app.STORAGE.load = lambda *args, **kwargs: sys.exit("se volvió a descargar lo que se subió")
+        assert app.refresh_dataset()
+""" % PLACE)
+
+
+@pytest.fixture
+def jsonbin():
+    with open(os.path.join(ROOT, "campeche.json"), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    servers = start_fakes(data, services=("jsonbin",))
+    yield servers
+    servers["jsonbin"].shutdown()
+
+
+def run_app(state_dir, servers, reviews, debounce, crash=False, refresh=False):
+    env = dict(os.environ, **fake_env(servers), NAAJ_STATE_DIR=str(state_dir), REVIEWS=str(reviews),
+               SAVE_DEBOUNCE_SECONDS=str(debounce), DATASET_REFRESH_SECONDS="0")
+    for key in ("GOOGLE_API_KEY", "GEMINI_API_KEY", "NAAJ_BACKGROUND_IN_WORKERS", "CRASH", "REFRESH"):
+        env.pop(key, None)
+    if crash: env["CRASH"] = "1"
+    if refresh: env["REFRESH"] = "1"
+    result = subprocess.run([sys.executable, "-c", CLIENT], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == (1 if crash else 0), result.stdout + result.stderr
+
+
+def stored_comments():
+    places = JsonBinHandler.record["restaurantes_famosos"]
+    place = next(p for p in places if p["nombre"] == PLACE)
+    return [r["comment"] for r in place.get("reviews", []) if r.get("comment", "").startswith("r")]
+
+
+def test_burst_of_reviews_is_one_put(tmp_path, jsonbin):
+    versions = JsonBinHandler.versions
+    run_app(tmp_path, jsonbin, reviews=10, debounce=1)
+    assert JsonBinHandler.versions - versions == 1
+    assert sorted(stored_comments()) == sorted(f"r{i}" for i in range(10))
+
+
+def test_reviews_survive_a_crash_before_the_flush(tmp_path, jsonbin):
+    versions = JsonBinHandler.versions
+    run_app(tmp_path, jsonbin, reviews=5, debounce=60, crash=True)
+    assert JsonBinHandler.versions == versions  # se cayó antes de subir
+    assert stored_comments() == []
+
+    # Al volver a arrancar se reaplica la bitácora y se sube en una sola escritura
+    run_app(tmp_path, jsonbin, reviews=0, debounce=0.2)
+    assert JsonBinHandler.versions - versions == 1
+    assert sorted(stored_comments()) == sorted(f"r{i}" for i in range(5))
+
+
+def test_own_upload_is_not_downloaded_again(tmp_path, jsonbin):
+    run_app(tmp_path, jsonbin, reviews=3, debounce=0.2, refresh=True)
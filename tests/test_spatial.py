@@ -0,0 +1,53 @@
+import random
+import time
+
+import pytest
+
+from spatial import SpatialIndex, haversine_many
+
+
+def campeche_index(n, seed=1):
+    rng = random.Random(seed)
+    index = SpatialIndex()
+    for i in range(n):
+        index.add(i, i, rng.uniform(17.8, 20.9), rng.uniform(-92.5, -89.1))
+    return index
+
+
+def brute_force(index, lat, lng, k, where=None):
+    idxs = [i for i, item in enumerate(index.items) if where is None or where(item)]
+    dists = haversine_many(lat, lng, [index.lats[i] for i in idxs], [index.lngs[i] for i in idxs])
+    return sorted(zip(dists, idxs))[:k]
+
+
+@pytest.mark.parametrize("lat, lng", [(19.84, -90.53), (18.65, -91.82), (21.5, -88.0)])
+def test_nearest_matches_brute_force(lat, lng):
+    index = campeche_index(3000)
+    got = index.nearest(lat, lng, 16)
+    assert [item for _, item in got] == [i for _, i in brute_force(index, lat, lng, 16)]
+    assert [d for d, _ in got] == sorted(d for d, _ in got)
+
+
+def test_nearest_with_filter():
+    index = campeche_index(3000)
+    where = lambda item: item % 7 == 0
+    got = index.nearest(19.84, -90.53, 10, where=where)
+    assert [item for _, item in got] == [i for _, i in brute_force(index, 19.84, -90.53, 10, where)]
+
+
+@pytest.mark.parametrize("lat, lng", [(40.4, -3.7), (-33.9, 151.2)])
+def test_far_away_query_is_fast_and_exact(lat, lng):
+    index = campeche_index(5000)
+    start = time.perf_counter()
+    got = index.nearest(lat, lng, 16)
+    # Antes se recorrían millones de celdas vacías (segundos de CPU)
+    assert time.perf_counter() - start < 0.5
+    assert [item for _, item in got] == [i for _, i in brute_force(index, lat, lng, 16)]
+
+
+def test_k_larger_than_located_places():
+    index = campeche_index(5)
+    got = index.nearest(19.84, -90.53, 16)
+    assert sorted(item for _, item in got) == [0, 1, 2, 3, 4]
+    assert [d for d, _ in got] == sorted(d for d, _ in got)
+    assert SpatialIndex().nearest(19.84, -90.53, 16) == []